@@ -0,0 +1,261 @@
+# Approximate nearest-neighbour (IVF) index over the 128D face descriptors
+#
+#   python ann_index.py build [--gallery PATH] [--nlist N]   build the index for the face gallery
+#   python ann_index.py benchmark [--sizes ...]   compare against brute force on synthetic galleries
+
+import argparse
+import glob
+import json
+import logging
+import os
+import shutil
+import time
+import zlib
+
+import numpy as np
+
+from face_gallery import FEATURE_DIM, GALLERY_PATH, FaceGallery, load_gallery
+
+#  Where the index for the gallery ("features_all.json") is kept
+INDEX_PATH = "data/features_all.ivf"
+
+#  Galleries smaller than this are searched exactly, an index does not pay off
+MIN_INDEX_GALLERY = int(os.environ.get("ANN_MIN_GALLERY", 5000))
+
+#  Recall/latency knobs: coarse cells visited per probe and candidates re-ranked exactly
+DEFAULT_NPROBE = int(os.environ.get("ANN_NPROBE", 8))
+DEFAULT_SHORTLIST = int(os.environ.get("ANN_SHORTLIST", 64))
+
+#  k-means is trained on at most this many descriptors
+KMEANS_SAMPLE_SIZE = 50000
+
+
+def gallery_checksum(features):
+    """Fingerprint of a descriptor matrix, used to tell whether an index is stale."""
+    return zlib.crc32(np.ascontiguousarray(features, dtype=np.float32).tobytes())
+
+
+def _sq_distances(a, b, b_sq_norms):
+    """(len(a), len(b)) squared e-distances, up to the per-row constant |a|^2."""
+    return b_sq_norms[None, :] - 2.0 * (a @ b.T)
+
+
+def _assign(vectors, centroids, chunk=16384):
+    """Index of the nearest centroid for every vector, computed in chunks."""
+    centroid_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        block = vectors[start:start + chunk]
+        labels[start:start + chunk] = np.argmin(_sq_distances(block, centroids, centroid_sq_norms), axis=1)
+    return labels
+
+
+def train_kmeans(vectors, nlist, n_iter=10, seed=0):
+    """Lloyd's k-means on a sample of the vectors, returning (nlist, 128) float32 centroids."""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > KMEANS_SAMPLE_SIZE:
+        vectors = vectors[rng.choice(len(vectors), KMEANS_SAMPLE_SIZE, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = _assign(vectors, centroids)
+        counts = np.bincount(labels, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty cells from random points so every list gets used
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index: k-means cells with float16 codes, re-ranked exactly in float32.
+
+    ``ids`` holds gallery row numbers grouped by cell, ``offsets[c]:offsets[c + 1]`` is the
+    slice of cell ``c`` in both ``ids`` and ``codes``.
+    """
+
+    def __init__(self, centroids, offsets, ids, codes, checksum):
+        self.centroids = centroids
+        self.centroid_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+        self.offsets = offsets
+        self.ids = ids
+        self.codes = codes
+        self.checksum = checksum
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, gallery, nlist=None, n_iter=10, seed=0):
+        """Build an index over the valid rows of a FaceGallery."""
+        row_ids = np.flatnonzero(gallery.valid)
+        vectors = gallery.features[row_ids]
+        if len(vectors) == 0:
+            raise ValueError("gallery has no valid descriptors to index")
+        if nlist is None:
+            nlist = max(1, int(4 * np.sqrt(len(vectors))))
+        nlist = max(1, min(nlist, len(vectors)))
+        centroids = train_kmeans(vectors, nlist, n_iter=n_iter, seed=seed)
+        labels = _assign(vectors, centroids)
+        order = np.argsort(labels, kind='stable')
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(labels, minlength=nlist))
+        return cls(centroids, offsets, row_ids[order], vectors[order].astype(np.float16),
+                   gallery_checksum(gallery.features))
+
+    def save(self, path):
+        """Write the index as a new generation directory of .npy files that can be memory-mapped.
+
+        ``meta.json`` names the current generation and is switched with one atomic rename,
+        so a loader sees either the complete old index or the complete new one. The
+        previous generation is kept for loaders that read the old meta.json just before.
+        """
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        generation = 1
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                generation = json.load(f).get("generation", 0) + 1
+        gen_dir = f"gen.{generation}"
+        os.makedirs(os.path.join(path, gen_dir), exist_ok=True)
+        for name, array in (("centroids", self.centroids), ("offsets", self.offsets),
+                            ("ids", self.ids), ("codes", self.codes)):
+            np.save(os.path.join(path, gen_dir, name + ".npy"), array)
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"generation": generation, "dir": gen_dir, "nlist": self.nlist,
+                       "count": len(self.ids), "checksum": self.checksum}, f)
+        os.replace(tmp_path, meta_path)
+
+        for old_dir in glob.glob(os.path.join(path, "gen.*")):
+            old_generation = os.path.basename(old_dir)[len("gen."):]
+            if old_generation.isdigit() and int(old_generation) < generation - 1:
+                shutil.rmtree(old_dir, ignore_errors=True)
+        if generation > 2:
+            # Files of an index written before generations, one generation behind by now
+            for name in ("centroids", "offsets", "ids", "codes"):
+                legacy_path = os.path.join(path, name + ".npy")
+                if os.path.exists(legacy_path):
+                    os.remove(legacy_path)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        # Indexes written before generations keep their files next to meta.json
+        gen_path = os.path.join(path, meta.get("dir", ""))
+        return cls(np.load(os.path.join(gen_path, "centroids.npy")),
+                   np.load(os.path.join(gen_path, "offsets.npy")),
+                   np.load(os.path.join(gen_path, "ids.npy"), mmap_mode="r"),
+                   np.load(os.path.join(gen_path, "codes.npy"), mmap_mode="r"),
+                   meta["checksum"])
+
+    def search(self, gallery, probes, k=1, nprobe=DEFAULT_NPROBE, shortlist=DEFAULT_SHORTLIST):
+        """Return ``(distances, indices)``, both (P, k), like FaceGallery.search.
+
+        Only the ``nprobe`` nearest cells are scanned with the float16 codes; the best
+        ``shortlist`` candidates are then re-ranked with exact float32 distances. Slots
+        that could not be filled hold an infinite distance and index -1.
+        """
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, FEATURE_DIM)
+        distances = np.full((len(probes), k), np.inf, dtype=np.float32)
+        indices = np.full((len(probes), k), -1, dtype=np.int64)
+        if len(probes) == 0 or k == 0:
+            return distances, indices
+        nprobe = max(1, min(nprobe, self.nlist))
+        cell_dist = _sq_distances(probes, self.centroids, self.centroid_sq_norms)
+        probe_cells = np.argpartition(cell_dist, nprobe - 1, axis=1)[:, :nprobe]
+
+        for p, probe in enumerate(probes):
+            slices = [slice(self.offsets[c], self.offsets[c + 1]) for c in probe_cells[p]]
+            ids = np.concatenate([self.ids[s] for s in slices])
+            if len(ids) == 0:
+                continue
+            codes = np.concatenate([self.codes[s] for s in slices]).astype(np.float32)
+            approx = np.einsum('ij,ij->i', codes, codes) - 2.0 * (codes @ probe)
+            m = min(max(shortlist, k), len(ids))
+            candidates = ids[np.argpartition(approx, m - 1)[:m]]
+            exact = np.linalg.norm(gallery.features[candidates] - probe, axis=1)
+            order = np.argsort(exact)[:k]
+            distances[p, :len(order)] = exact[order]
+            indices[p, :len(order)] = candidates[order]
+        return distances, indices
+
+
+def load_index_for(gallery, path=INDEX_PATH):
+    """Load the index at ``path`` if it exists and was built from this gallery, else None."""
+    if len(gallery) < MIN_INDEX_GALLERY or not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    index = IVFIndex.load(path)
+    if index.checksum != gallery_checksum(gallery.features):
+        logging.warning("ANN index '%s' does not match the gallery, using exact search", path)
+        return None
+    logging.info("Using ANN index '%s' (%d cells)", path, index.nlist)
+    return index
+
+
+def synthetic_gallery(size, seed=0):
+    """Clustered unit-scale 128D vectors roughly shaped like Dlib descriptors."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(max(1, size // 500), FEATURE_DIM)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    features = centres[rng.integers(len(centres), size=size)]
+    features = features + rng.normal(scale=0.035, size=features.shape).astype(np.float32)
+    rolls = [str(i) for i in range(size)]
+    return FaceGallery(rolls, rolls, features)
+
+
+def benchmark(sizes, n_queries=200, nprobes=(1, 4, 8, 16, 32), shortlist=DEFAULT_SHORTLIST):
+    """Print build time, latency and recall@1 of the index against brute force."""
+    rng = np.random.default_rng(1)
+    print(f"{'gallery':>8} {'method':>14} {'ms/query':>9} {'recall@1':>9}")
+    for size in sizes:
+        gallery = synthetic_gallery(size)
+        targets = rng.integers(size, size=n_queries)
+        queries = gallery.features[targets] + rng.normal(scale=0.02, size=(n_queries, FEATURE_DIM)).astype(np.float32)
+
+        start = time.perf_counter()
+        exact_idx = np.concatenate([gallery.search(q[None, :], k=1)[1][:, 0] for q in queries])
+        brute_ms = (time.perf_counter() - start) * 1000 / n_queries
+        print(f"{size:>8} {'brute force':>14} {brute_ms:>9.3f} {1.0:>9.3f}")
+
+        start = time.perf_counter()
+        index = IVFIndex.build(gallery)
+        print(f"{size:>8} {'build':>14} {'':>9} {'':>9}  ({time.perf_counter() - start:.1f}s, {index.nlist} cells)")
+        for nprobe in nprobes:
+            start = time.perf_counter()
+            ann_idx = np.concatenate([index.search(gallery, q[None, :], k=1, nprobe=nprobe,
+                                                   shortlist=shortlist)[1][:, 0] for q in queries])
+            ann_ms = (time.perf_counter() - start) * 1000 / n_queries
+            recall = float(np.mean(ann_idx == exact_idx))
+            print(f"{size:>8} {'nprobe=' + str(nprobe):>14} {ann_ms:>9.3f} {recall:>9.3f}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build or benchmark the face descriptor ANN index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="build the index for the binary face gallery")
+    build_cmd.add_argument("--gallery", default=GALLERY_PATH,
+                           help="gallery manifest (falls back to the legacy features_all.csv if missing)")
+    build_cmd.add_argument("--output", default=INDEX_PATH)
+    build_cmd.add_argument("--nlist", type=int, default=None)
+    bench_cmd = sub.add_parser("benchmark", help="compare against brute force on synthetic galleries")
+    bench_cmd.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000, 200000])
+    bench_cmd.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        gallery = load_gallery(args.gallery)
+        IVFIndex.build(gallery, nlist=args.nlist).save(args.output)
+        logging.info("Index for %d faces written to %s", len(gallery), args.output)
+    else:
+        benchmark(args.sizes, n_queries=args.queries)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@ from flask import Flask, render_template, request, jsonify, session, redirect, u
 import os
 import sqlite3
 import base64
+import binascii
 import cv2
 import numpy as np
 import json
@@ -13,6 +14,17 @@ import datetime
 import sys
 import functools # Import functools for the login_required decorator
 import bcrypt # Import bcrypt for password hashing
+from attendance_buffer import get_attendance_buffer
+from db import get_connection
+from face_gallery import memory_usage
+from migrations import migrate
+from recognition_client import RECOGNITION_SOCKET, RecognitionServiceError, get_client
+from recognition_jobs import QueueFull, get_job_queue
+from report_queries import (ATTENDANCE_DATA_QUERY, ATTENDANCE_SUMMARY_QUERY, CLASSES_HELD_QUERY,
+                            CLASSES_WITH_PRESENCE_QUERY, COURSES_IN_SEMESTER_QUERY, attendance_trend_sql,
+                            build_date_filter_sql, course_stats_sql, low_attendance_query, overall_attendance_sql)
+# recognition_engine and face_detection (Dlib) are imported where they are used, so web
+# workers that forward to the recognition service never load them
 
 SELECT_ID_FROM_STUDENTS_BY_ROLL = "SELECT id FROM students WHERE roll_number = ?"
 
@@ -53,7 +65,6 @@ app.secret_key = os.environ.get('SECRET_KEY', os.urandom(24))
 FACE_IMAGES_DIR = "data/data_faces_from_camera/"
 os.makedirs(FACE_IMAGES_DIR, exist_ok=True)
 DB_NAME = 'attendance.db' # Define DB Name centrally
-ATTENDANCE_SUMMARY_QUERY = "SELECT SUM(present), COUNT(*) FROM attendance"
 SELECT_COURSES_QUERY = "SELECT id, name FROM courses"
 SELECT_COURSE_NAME_BY_ID_QUERY = "SELECT name FROM courses WHERE id = ?"
 SELECT_STUDENT_COUNT_QUERY = "SELECT COUNT(*) FROM students"
@@ -99,10 +110,8 @@ def check_password(hashed_password_str, password_str):
 
 # --- Database Helper ---
 def get_db():
-    """ Function to get a database connection """
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row # Return rows as dictionary-like objects
-    return conn
+    """ Function to get this thread's pooled database connection (rows as sqlite3.Row) """
+    return get_connection(DB_NAME)
 
 
 # --- Authentication Decorator ---
@@ -348,14 +357,7 @@ def fetch_course_name(cursor, course_id):
 
 def fetch_attendance_data(cursor, selected_date, course_id):
     print(f"Executing query for date {selected_date}, course ID {course_id}")
-    cursor.execute("""
-        SELECT s.roll_number, s.name, c.name as course_name, a.present
-        FROM attendance a
-        JOIN students s ON a.student_id = s.id
-        JOIN courses c ON a.course_id = c.id
-        WHERE a.date = ? AND a.course_id = ?
-        ORDER BY s.roll_number
-    """, (selected_date, course_id))
+    cursor.execute(ATTENDANCE_DATA_QUERY, (selected_date, course_id))
     data = cursor.fetchall()
     print(f"Query returned {len(data) if data is not None else 0} records.")
     return data
@@ -523,8 +525,37 @@ def _validate_capture_session():
          return None, (jsonify({"status": "error", "message": "Registration folder not found."}), 404)
     return folder_path, None # Return path if valid, None for error response
 
+def _read_binary_image_upload():
+    """Returns the encoded bytes of a raw image/* body or a multipart 'image' file.
+
+    Returns (None, None) when the request carries neither, so callers can fall back to
+    their base64 field.
+    """
+    if request.mimetype and request.mimetype.startswith('image/'):
+        image_bytes = request.get_data(cache=False)
+    elif 'image' in request.files:
+        image_bytes = request.files['image'].read()
+    else:
+        return None, None
+    if not image_bytes:
+        return None, "Empty image upload."
+    return image_bytes, None
+
+def decode_image_bytes(image_bytes):
+    """Decodes JPEG/PNG bytes straight into a BGR array with a single cv2.imdecode."""
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None, "Could not decode image."
+    return image, None
+
 def _decode_image_from_request(request_form):
-    """Decodes the base64 image data from the request."""
+    """Decodes the uploaded image (binary upload or base64 'image_data' field) from the request."""
+    image_bytes, error = _read_binary_image_upload()
+    if error:
+        return None, error
+    if image_bytes is not None:
+        return decode_image_bytes(image_bytes)
+
     image_data = request_form.get('image_data')
     if not image_data:
         return None, "No image data received."
@@ -533,40 +564,37 @@ def _decode_image_from_request(request_form):
         image_data_parts = image_data.split(",")
         if len(image_data_parts) != 2:
              return None, "Invalid image data format."
-        image_binary = base64.b64decode(image_data_parts[1])
-        nparr = np.frombuffer(image_binary, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if image is None:
-             return None, "Could not decode image."
-        return image, None # Return image array if successful
+        return decode_image_bytes(base64.b64decode(image_data_parts[1], validate=True))
+    except binascii.Error as e:
+        return None, f"Invalid image data: {e}"
     except Exception as e:
         return None, f"Error decoding image: {str(e)}"
 
-def _find_cascade_file():
-    """Finds the path to the Haar cascade file."""
-    cascade_filename = 'haarcascade_frontalface_default.xml'
-    base_dir = os.path.dirname(__file__)
-    cascade_path = os.path.join(base_dir, cascade_filename)
-    if not os.path.exists(cascade_path):
-         cascade_path = os.path.join(cv2.data.haarcascades, cascade_filename)
-         if not os.path.exists(cascade_path):
-             print(f"Haar cascade file not found...", file=sys.stderr)
-             return None
-    print(f"Using cascade file: {cascade_path}")
-    return cascade_path
-
-def _detect_and_crop_face(image, cascade_path):
+_capture_detector = None
+
+def _get_capture_detector():
+    """Returns the registration capture's face detector (CAPTURE_DETECTOR_BACKEND), created once."""
+    global _capture_detector
+    if _capture_detector is None:
+        try:
+            from face_detection import CAPTURE_DETECTOR_BACKEND, create_detector
+            _capture_detector = create_detector(CAPTURE_DETECTOR_BACKEND)
+            print(f"Using face detector: {_capture_detector.label}")
+        except Exception as e:
+            print(f"Face detector could not be created: {e}", file=sys.stderr)
+            return None
+    return _capture_detector
+
+def _detect_and_crop_face(image, detector):
     """Detects a single face, crops, and resizes it."""
-    face_cascade = cv2.CascadeClassifier(cascade_path)
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=8, minSize=(40, 40))
+    faces = detector.detect(image)
 
     if len(faces) == 0:
         return None, "No face detected in the captured image."
     if len(faces) > 1:
         print(f"Warning: Multiple faces detected ({len(faces)}). Using the first.")
 
-    x, y, w, h = faces[0]
+    x, y, w, h = faces[0].left(), faces[0].top(), faces[0].width(), faces[0].height()
     padding = int(max(w, h) * 0.3)
     x_start = max(0, x - padding)
     y_start = max(0, y - padding)
@@ -615,17 +643,17 @@ def capture_image():
         print(f"Image decode error: {error_msg}")
         return jsonify({"status": "error", "message": error_msg}), 400
 
-    # 3. Load Cascade
-    cascade_path = _find_cascade_file()
-    if not cascade_path:
-        flash("Facial recognition cascade file not found on server.", "danger")
+    # 3. Load Face Detector
+    detector = _get_capture_detector()
+    if detector is None:
+        flash("Face detector model files not found on server.", "danger")
         return jsonify({"status": "error", "message": "Facial recognition configuration error."}), 500
 
     # --- Wrapped Face Processing in try/except ---
     # This reduces nesting inside the main try block of the original function
     try:
         # 4. Detect and Crop Face
-        resized_face, error_msg = _detect_and_crop_face(image, cascade_path)
+        resized_face, error_msg = _detect_and_crop_face(image, detector)
         if error_msg:
              # Use 400 for detection issues, 500 for cropping/resizing issues
              status_code = 400 if "No face detected" in error_msg else 500
@@ -752,6 +780,7 @@ def run_feature_extraction():
         print(f"Feature Extraction stdout:\n{result.stdout}")
         if result.stderr:
             print(f"Feature Extraction stderr:\n{result.stderr}", file=sys.stderr)
+        reload_recognizer_gallery() # Pick up the new features in the cached gallery
         flash("Registration complete! Student data saved and face features updated.", "success")
         print("Feature extraction completed successfully (or with warnings).")
     except FileNotFoundError:
@@ -784,15 +813,6 @@ def _get_filter_dates(selected_semester):
         print("No semester filter applied.")
     return start_date, end_date
 
-def _build_date_filter_sql(start_date, end_date):
-    """Builds the WHERE clause and parameters for date filtering."""
-    date_filter_sql = ""
-    query_params = []
-    if start_date and end_date:
-        date_filter_sql = " WHERE a.date BETWEEN ? AND ? "
-        query_params = [start_date, end_date]
-    return date_filter_sql, query_params
-
 def _fetch_all_courses_for_report(cursor):
     """Fetches all courses for the report dropdown."""
     try:
@@ -806,7 +826,7 @@ def _fetch_all_courses_for_report(cursor):
 
 def _calculate_overall_attendance(cursor, date_filter_sql, query_params):
     """Calculates the overall attendance percentage within the filtered dates."""
-    overall_sql = f"SELECT SUM(present), COUNT(*) FROM attendance a {date_filter_sql.replace(' WHERE', 'WHERE') if date_filter_sql else ''}"
+    overall_sql = overall_attendance_sql(date_filter_sql)
     print(f"Executing overall SQL: {overall_sql} with params {query_params}")
     cursor.execute(overall_sql, query_params)
     overall_res = cursor.fetchone()
@@ -818,15 +838,7 @@ def _calculate_overall_attendance(cursor, date_filter_sql, query_params):
 
 def _calculate_course_stats(cursor, date_filter_sql, query_params):
     """Calculates attendance statistics for each course within the filtered dates."""
-    course_sql = f"""
-        SELECT
-            c.id, c.name, SUM(a.present) AS total_present, COUNT(a.id) AS total_records
-        FROM attendance a
-        JOIN courses c ON a.course_id = c.id
-        {date_filter_sql.replace(' WHERE', 'WHERE') if date_filter_sql else ''}
-        GROUP BY c.id, c.name
-        ORDER BY c.name
-    """
+    course_sql = course_stats_sql(date_filter_sql)
     print(f"Executing course stats SQL: {course_sql} with params {query_params}")
     cursor.execute(course_sql, query_params)
     course_stats_raw = cursor.fetchall()
@@ -844,12 +856,7 @@ def _calculate_course_stats(cursor, date_filter_sql, query_params):
 
 def _calculate_attendance_trend(cursor, date_filter_sql, query_params):
     """Calculates the monthly attendance trend within the filtered dates."""
-    trend_sql = f"""
-        SELECT strftime('%Y-%m', date) AS month, SUM(present) AS monthly_present, COUNT(id) AS monthly_total
-        FROM attendance a
-        {date_filter_sql.replace(' WHERE', 'WHERE') if date_filter_sql else ''}
-        GROUP BY month ORDER BY month
-    """
+    trend_sql = attendance_trend_sql(date_filter_sql)
     print(f"Executing trend SQL: {trend_sql} with params {query_params}")
     cursor.execute(trend_sql, query_params)
     trend_raw = cursor.fetchall()
@@ -898,32 +905,8 @@ def _validate_course_filter(cursor, selected_course_id):
 
 def _calculate_low_attendance_students(cursor, start_date, end_date, valid_course_id_int, low_threshold):
     """Calculates the list of students below the low attendance threshold, applying filters."""
-    where_clauses = []
-    query_params = []
-
-    if start_date and end_date:
-        where_clauses.append("a.date BETWEEN ? AND ?")
-        query_params.extend([start_date, end_date])
-
-    if valid_course_id_int is not None: # Use the validated integer ID
-        where_clauses.append("a.course_id = ?")
-        query_params.append(valid_course_id_int)
-
-    where_sql = ""
-    if where_clauses:
-        where_sql = " WHERE " + " AND ".join(where_clauses)
-
-    low_attendance_sql = f"""
-        SELECT
-            s.id, s.roll_number, s.name,
-            SUM(CASE WHEN a.present = 1 THEN 1 ELSE 0 END) AS student_present_period,
-            COUNT(a.id) AS student_total_period
-        FROM students s
-        JOIN attendance a ON s.id = a.student_id
-        {where_sql}
-        GROUP BY s.id, s.roll_number, s.name
-        HAVING COUNT(a.id) > 0
-    """
+    # Use the validated integer ID
+    low_attendance_sql, query_params = low_attendance_query(start_date, end_date, valid_course_id_int)
     print(f"Executing low attendance SQL: {low_attendance_sql} with params {query_params}")
     cursor.execute(low_attendance_sql, query_params)
     period_student_stats = cursor.fetchall()
@@ -992,7 +975,7 @@ def reports():
 
         # Determine date range based on semester
         start_date, end_date = _get_filter_dates(selected_semester)
-        date_filter_sql, date_query_params = _build_date_filter_sql(start_date, end_date)
+        date_filter_sql, date_query_params = build_date_filter_sql(start_date, end_date)
 
         # Calculate report sections using helpers
         overall_percentage = _calculate_overall_attendance(cursor, date_filter_sql, date_query_params)
@@ -1269,40 +1252,22 @@ def fetch_student_by_roll(cursor, roll_number):
     return cursor.fetchone()
 
 def fetch_courses_in_semester(cursor, start_date, end_date):
-    cursor.execute("""
-        SELECT DISTINCT c.id, c.name
-        FROM attendance a
-        JOIN courses c ON a.course_id = c.id
-        WHERE a.date BETWEEN ? AND ?
-        ORDER BY c.name
-    """, (start_date, end_date))
+    cursor.execute(COURSES_IN_SEMESTER_QUERY, (start_date, end_date))
     return cursor.fetchall()
 
 def fetch_attendance_counts(cursor, student_id, course_id, start_date, end_date):
     # Total classes held
-    cursor.execute("""
-        SELECT COUNT(DISTINCT date)
-        FROM attendance
-        WHERE course_id = ? AND date BETWEEN ? AND ?
-    """, (course_id, start_date, end_date))
+    cursor.execute(CLASSES_HELD_QUERY, (course_id, start_date, end_date))
     total_classes_held_res = cursor.fetchone()
     total_classes_held = total_classes_held_res[0] if total_classes_held_res and total_classes_held_res[0] is not None else 0
 
     # Classes attended
-    cursor.execute("""
-        SELECT COUNT(*)
-        FROM attendance
-        WHERE student_id = ? AND course_id = ? AND present = 1 AND date BETWEEN ? AND ?
-    """, (student_id, course_id, start_date, end_date))
+    cursor.execute(CLASSES_WITH_PRESENCE_QUERY, (student_id, course_id, 1, start_date, end_date))
     total_present_res = cursor.fetchone()
     total_present = total_present_res[0] if total_present_res and total_present_res[0] is not None else 0
 
     # Classes absent
-    cursor.execute("""
-        SELECT COUNT(*)
-        FROM attendance
-        WHERE student_id = ? AND course_id = ? AND present = 0 AND date BETWEEN ? AND ?
-    """, (student_id, course_id, start_date, end_date))
+    cursor.execute(CLASSES_WITH_PRESENCE_QUERY, (student_id, course_id, 0, start_date, end_date))
     total_absent_res = cursor.fetchone()
     total_absent = total_absent_res[0] if total_absent_res and total_absent_res[0] is not None else 0
 
@@ -1313,7 +1278,7 @@ def fetch_attendance_counts(cursor, student_id, course_id, start_date, end_date)
 @login_required
 def take_attendance():
     # Fetch all courses to display in the dropdown
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     cursor = conn.cursor()
     try:
         cursor.execute(SELECT_COURSES_QUERY)
@@ -1326,109 +1291,272 @@ def take_attendance():
     return render_template('take_attendance.html', courses=courses, logged_in_username=session.get('username'))
 
 # --- API endpoint for browser-based face recognition ---
-from io import BytesIO
-from PIL import Image
-import re
-
 @app.route('/api/recognize_face', methods=['POST'])
 @login_required
 @csrf.exempt
 def api_recognize_face():
-    data = request.get_json()
-    img_data = data.get('image')
-    course_id = data.get('course_id')
-    if not img_data or not course_id:
-        return jsonify({'status': 'error', 'message': 'Missing image or course_id'}), 400
-    
-    img_bgr, err = parse_base64_image(img_data)
-    if err:
-        return jsonify({'status': 'error', 'message': f'Invalid image data: {err}'}), 400
-    
+    image_bytes, course_id, top_k, error_response = _read_recognition_request()
+    if error_response:
+        return error_response
+    if RECOGNITION_SOCKET:
+        # The recognition service decodes the image itself
+        image = image_bytes
+    else:
+        image, err = decode_image_bytes(image_bytes)
+        if err:
+            return jsonify({'status': 'error', 'message': f'Invalid image data: {err}'}), 400
+
+    # Snapshots from one camera page share a session_id so tracked faces are not re-embedded
+    session_id = request.values.get('session_id') or (request.get_json(silent=True) or {}).get('session_id')
     try:
-        recognized_people, face_error = recognize_faces_and_mark_attendance(img_bgr, course_id)
+        recognized_people, face_error, tracking = recognize_faces_and_mark_attendance(image, course_id, top_k, session_id)
         if face_error:
             return jsonify({'status': 'error', 'message': face_error}), 500
-        if not recognized_people:
-            return jsonify({'status': 'success', 'recognized': []})
-        return jsonify({'status': 'success', 'recognized': recognized_people})
+        response = {'status': 'success', 'recognized': recognized_people or []}
+        if tracking:
+            response['tracking'] = tracking
+        return jsonify(response)
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'Recognition error: {e}'}), 500
 
 
+def _read_recognition_request():
+    """Reads the encoded image, course_id and top_k of a recognition request.
+
+    Binary uploads (raw image/jpeg body or multipart 'image' file) carry course_id and top_k
+    in the query string/form; JSON with a base64 data URL is still accepted. Returns
+    (image_bytes, course_id, top_k, error_response).
+    """
+    image_bytes, err = _read_binary_image_upload()
+    if err:
+        return None, None, None, (jsonify({'status': 'error', 'message': err}), 400)
+    if image_bytes is not None:
+        data = request.form if request.files else request.args
+    else:
+        data = request.get_json(silent=True) or {}
+        if data.get('image'):
+            try:
+                image_bytes = base64.b64decode(re.sub('^data:image/.+;base64,', '', data['image']), validate=True)
+            except (binascii.Error, TypeError) as e:
+                return None, None, None, (jsonify({'status': 'error', 'message': f'Invalid image data: {e}'}), 400)
+    course_id = data.get('course_id')
+    if not image_bytes or not course_id:
+        return None, None, None, (jsonify({'status': 'error', 'message': 'Missing image or course_id'}), 400)
+    try:
+        top_k = int(data.get('top_k', 1))
+    except (TypeError, ValueError):
+        return None, None, None, (jsonify({'status': 'error', 'message': 'top_k must be an integer'}), 400)
+    return image_bytes, course_id, top_k, None
+
+
 def parse_base64_image(img_data):
-    import re, base64
-    from PIL import Image
-    from io import BytesIO
+    """Decodes a base64 (data URL) image, kept for JSON clients.
+
+    With the recognition service the encoded bytes are returned as they are, since the
+    service decodes them itself and they are several times smaller than the pixels.
+    """
     try:
-        img_str = re.sub('^data:image/.+;base64,', '', img_data)
-        img_bytes = base64.b64decode(img_str)
-        img = Image.open(BytesIO(img_bytes)).convert('RGB')
-        img_np = np.array(img)
-        img_bgr = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
-        return img_bgr, None
-    except Exception as e:
+        image_bytes = base64.b64decode(re.sub('^data:image/.+;base64,', '', img_data), validate=True)
+    except (binascii.Error, TypeError) as e:
         return None, str(e)
+    if RECOGNITION_SOCKET:
+        return (image_bytes, None) if image_bytes else (None, "Empty image.")
+    return decode_image_bytes(image_bytes)
+
 
+def get_recognizer():
+    """The recognition service client when RECOGNITION_SOCKET is set, otherwise this worker's engine."""
+    if RECOGNITION_SOCKET:
+        return get_client()
+    from recognition_engine import get_engine
+    return get_engine()
 
-def recognize_faces_and_mark_attendance(img_bgr, course_id):
+
+def reload_recognizer_gallery():
+    if not RECOGNITION_SOCKET:
+        from recognition_engine import reload_gallery
+        reload_gallery()
+        return
     try:
-        from attendance_taker import Face_Recognizer
-        recognizer = Face_Recognizer(course_id)
-        recognizer.get_face_database()
-        detector = getattr(recognizer, 'detector', None)
-        if detector is None:
-            import dlib
-            detector = dlib.get_frontal_face_detector()
-        faces = detector(img_bgr, 1)
-        if len(faces) == 0:
-            return [], None
-        predictor = getattr(recognizer, 'predictor', None)
-        face_reco_model = getattr(recognizer, 'face_reco_model', None)
-        if predictor is None or face_reco_model is None:
-            import dlib
-            predictor = dlib.shape_predictor(r"data/data_dlib/shape_predictor_68_face_landmarks.dat")
-            face_reco_model = dlib.face_recognition_model_v1(r"data/data_dlib/dlib_face_recognition_resnet_model_v1.dat")
-        recognized_people = []
-        for face in faces:
-            shape = predictor(img_bgr, face)
-            features = face_reco_model.compute_face_descriptor(img_bgr, shape)
-            min_dist, min_idx = float('inf'), -1
-            for i, feat_known in enumerate(recognizer.face_features_known_list):
-                dist = recognizer.return_euclidean_distance(features, feat_known)
-                if dist < min_dist:
-                    min_dist, min_idx = dist, i
-            if min_dist < 0.4 and min_idx >= 0:
-                roll = recognizer.face_roll_number_known_list[min_idx]
-                name = recognizer.face_name_known_list[min_idx]
-                recognized_people.append({'name': name, 'roll': roll})
-                mark_attendance_for_student(roll, course_id)
-            else:
-                recognized_people.append({'name': 'Unknown', 'roll': '-'})
-        return recognized_people, None
+        get_client().reload_gallery()
+    except RecognitionServiceError as e:
+        # The service also notices the new gallery files on its own
+        print(f"[WARN] Recognition service gallery reload failed: {e}", file=sys.stderr)
+
+
+def recognize_faces_and_mark_attendance(image, course_id, top_k=1, session_id=None):
+    """Recognizes a BGR image (or, with the recognition service, encoded image bytes) and marks attendance.
+
+    Returns (recognized_people, error, tracking); tracking holds the descriptor counts of a
+    camera session snapshot and is None without a session_id.
+    """
+    try:
+        tracking = None
+        if session_id:
+            matches, tracking = get_recognizer().recognize_session(image, str(session_id)[:64], top_k=top_k)
+        else:
+            matches = get_recognizer().recognize(image, top_k=top_k)
+        return mark_attendance_for_matches(matches, course_id, top_k), None, tracking
     except Exception as e:
-        return [], str(e)
+        return [], str(e), None
+
+
+def mark_attendance_for_matches(matches, course_id, top_k=1):
+    """Marks every recognized student present and formats the matches for the JSON response."""
+    recognized_people = []
+    for match in matches:
+        if match['roll'] != '-':
+            mark_attendance_for_student(match['roll'], course_id)
+        person = {'name': match['name'], 'roll': match['roll'], 'distance': match['distance']}
+        if top_k > 1:
+            person['candidates'] = match['candidates']
+        recognized_people.append(person)
+    return recognized_people
+
+
+MAX_BATCH_FRAMES = 16
+
+
+@app.route('/api/recognize_faces_batch', methods=['POST'])
+@login_required
+@csrf.exempt
+def api_recognize_faces_batch():
+    """Recognizes several frames, possibly from different cameras and courses, in one request."""
+    data = request.get_json(silent=True) or {}
+    frames = data.get('frames')
+    if not isinstance(frames, list) or not frames:
+        return jsonify({'status': 'error', 'message': 'Missing frames'}), 400
+    if len(frames) > MAX_BATCH_FRAMES:
+        return jsonify({'status': 'error', 'message': f'At most {MAX_BATCH_FRAMES} frames per request'}), 400
+    try:
+        top_k = int(data.get('top_k', 1))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'top_k must be an integer'}), 400
+
+    # Decode every frame first (the service decodes them itself); frames with bad input are
+    # reported without failing the batch
+    frame_results, images, decoded_idx = [], [], []
+    for i, frame in enumerate(frames):
+        frame = frame if isinstance(frame, dict) else {}
+        course_id = frame.get('course_id', data.get('course_id'))
+        result = {'index': i, 'camera_id': frame.get('camera_id'), 'course_id': course_id}
+        frame_results.append(result)
+        if not frame.get('image') or not course_id:
+            result.update({'status': 'error', 'message': 'Missing image or course_id'})
+            continue
+        image, err = parse_base64_image(frame['image'])
+        if err:
+            result.update({'status': 'error', 'message': f'Invalid image data: {err}'})
+            continue
+        images.append(image)
+        decoded_idx.append(i)
+
+    try:
+        matches_per_frame = get_recognizer().recognize_batch(images, top_k=top_k) if images else []
+    except RecognitionServiceError as e:
+        if len(images) < 2:
+            return jsonify({'status': 'error', 'message': f'Recognition error: {e}'}), 500
+        # The service rejects the whole batch when one frame cannot be decoded; retry the
+        # frames one by one so only the bad ones are reported
+        matches_per_frame = []
+        for i, image in zip(decoded_idx, images):
+            try:
+                matches_per_frame.append(get_recognizer().recognize(image, top_k=top_k))
+            except RecognitionServiceError as frame_e:
+                matches_per_frame.append(None)
+                frame_results[i].update({'status': 'error', 'message': f'Recognition error: {frame_e}'})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': f'Recognition error: {e}'}), 500
+
+    for i, matches in zip(decoded_idx, matches_per_frame):
+        if matches is None:
+            continue
+        result = frame_results[i]
+        result['status'] = 'success'
+        result['recognized'] = mark_attendance_for_matches(matches, result['course_id'], top_k)
+    return jsonify({'status': 'success', 'frames': frame_results})
+
+
+# --- Asynchronous recognition jobs ---
+MAX_JOB_WAIT_SECONDS = 10
+
+@app.route('/api/recognition_jobs', methods=['POST'])
+@login_required
+@csrf.exempt
+def api_submit_recognition_job():
+    """Queues a frame for recognition (local worker pool or recognition service) and returns its job id."""
+    image_bytes, course_id, top_k, error_response = _read_recognition_request()
+    if error_response:
+        return error_response
+    try:
+        job_id = get_job_queue(DB_NAME, mark_attendance_for_matches).submit(image_bytes, course_id, top_k)
+    except QueueFull as e:
+        response = jsonify({'status': 'busy', 'message': f'Recognition queue is full, retry shortly ({e}).'})
+        response.headers['Retry-After'] = '1'
+        return response, 429
+    return jsonify({'status': 'queued', 'job_id': job_id,
+                    'result_url': url_for('api_recognition_job_result', job_id=job_id)}), 202
+
+
+@app.route('/api/recognition_jobs/<job_id>', methods=['GET'])
+@login_required
+def api_recognition_job_result(job_id):
+    """Returns a job's result; ?wait=N long-polls up to N seconds for a queued job."""
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0.0), MAX_JOB_WAIT_SECONDS)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'wait must be a number'}), 400
+    job = get_job_queue(DB_NAME, mark_attendance_for_matches).get(job_id, wait=wait)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Unknown or expired job id'}), 404
+    if job['status'] == 'queued':
+        return jsonify({'status': 'queued', 'job_id': job_id}), 202
+    if job['status'] == 'error':
+        return jsonify({'status': 'error', 'job_id': job_id, 'message': job['error']}), 500
+    return jsonify({'status': 'success', 'job_id': job_id, 'recognized': job['result']})
+
+
+@app.route('/api/recognizer/stats', methods=['GET'])
+@login_required
+def api_recognizer_stats():
+    """Memory and gallery state of the worker that served this request (and of the recognition service)."""
+    if RECOGNITION_SOCKET:
+        # This worker never loads the engine; the service reports its own below
+        stats = {'pid': os.getpid(), 'engine_loaded': False, 'memory': memory_usage()}
+    else:
+        from recognition_engine import engine_stats
+        stats = engine_stats()
+    stats['attendance'] = get_attendance_buffer(DB_NAME).stats()
+    if RECOGNITION_SOCKET:
+        try:
+            stats['service'] = get_client().stats()
+        except RecognitionServiceError as e:
+            stats['service'] = {'error': str(e)}
+    return jsonify({'status': 'success', 'stats': stats})
 
 
 def mark_attendance_for_student(roll, course_id):
+    """Marks a student present today; repeat marks are skipped and the rest written in batches."""
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        today = datetime.datetime.now().strftime('%Y-%m-%d')
-        cursor.execute(SELECT_ID_FROM_STUDENTS_BY_ROLL, (roll,))
-        student = cursor.fetchone()
-        if student:
-            student_id = student[0]
-            cursor.execute("""
-                UPDATE attendance SET present=1 WHERE student_id=? AND course_id=? AND date=?
-            """, (student_id, course_id, today))
-            if cursor.rowcount == 0:
-                cursor.execute("""
-                    INSERT INTO attendance (student_id, course_id, date, present) VALUES (?, ?, ?, 1)
-                """, (student_id, course_id, today))
-            conn.commit()
-        conn.close()
+        get_attendance_buffer(DB_NAME).mark(roll, course_id)
     except Exception as db_e:
         print(f"[ERROR] Attendance DB update: {db_e}")
+
+
+# Bring attendance.db to the current schema (once in the gunicorn master when preloading)
+migrate(DB_NAME)
+
+# Load the models and gallery before gunicorn forks its workers (see gunicorn.conf.py);
+# with RECOGNITION_SOCKET set they live in recognition_server.py instead
+# A missing model file must not take the dashboard and reports down: the engine is then
+# created on the first recognition request instead, which reports the error
+if os.environ.get('PRELOAD_RECOGNIZER') == '1' and not RECOGNITION_SOCKET:
+    try:
+        from recognition_engine import get_engine
+        get_engine()
+    except Exception as e:
+        print(f"[WARN] Recognizer not preloaded, it will load on first use: {e}", file=sys.stderr)
+
 if __name__ == '__main__':
 
     app.run()
\ No newline at end of file
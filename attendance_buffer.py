@@ -0,0 +1,157 @@
+# Write-behind buffer for attendance marks
+#
+# A recognized student is usually seen on many frames in a row. The buffer remembers who
+# is already present per (course, date) so repeat marks never touch SQLite, and writes the
+# new marks in batches: one transaction every ATTENDANCE_FLUSH_INTERVAL seconds, or sooner
+# once ATTENDANCE_FLUSH_SIZE marks are waiting. Pending marks are flushed at exit.
+
+import atexit
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from db import get_connection, retry_on_busy
+from migrations import migrate
+
+#  Seconds between flushes and the number of pending marks that triggers an early flush
+ATTENDANCE_FLUSH_INTERVAL = float(os.environ.get("ATTENDANCE_FLUSH_INTERVAL", 2.0))
+ATTENDANCE_FLUSH_SIZE = int(os.environ.get("ATTENDANCE_FLUSH_SIZE", 100))
+
+#  (course, date) "already present" sets kept in memory, least recently used dropped first
+MAX_MARKED_SESSIONS = 256
+
+#  Insert or update the student's row for the course and date in one statement (relies on
+#  the unique index of migration 1); changes no row when the roll number is unknown
+MARK_PRESENT = """
+    INSERT INTO attendance (student_id, course_id, date, present)
+    SELECT id, ?, ?, 1 FROM students WHERE roll_number = ?
+    ON CONFLICT (student_id, course_id, date) DO UPDATE SET present = 1
+"""
+
+
+class AttendanceBuffer:
+    """Per-process set of marked students plus a batch of marks not yet written."""
+
+    def __init__(self, db_path, flush_interval=ATTENDANCE_FLUSH_INTERVAL, flush_size=ATTENDANCE_FLUSH_SIZE):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._marked = OrderedDict()    # (course_id, date) -> set of rolls
+        self._pending = []              # (roll, course_id, date) not written yet
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self.marks = self.skipped = self.writes = self.flushes = 0
+        # MARK_PRESENT needs the unique index
+        migrate(db_path)
+
+    def mark(self, roll, course_id, date=None):
+        """Queue ``roll`` as present; False if it was already marked for the course and date."""
+        roll, course_id = str(roll), str(course_id)
+        key = (course_id, date or datetime.datetime.now().strftime('%Y-%m-%d'))
+        with self._lock:
+            self.marks += 1
+            marked = self._marked.get(key)
+            if marked is None:
+                marked = self._marked[key] = set()
+                if len(self._marked) > MAX_MARKED_SESSIONS:
+                    self._marked.popitem(last=False)
+            else:
+                self._marked.move_to_end(key)
+            if roll in marked:
+                self.skipped += 1
+                return False
+            marked.add(roll)
+            self._pending.append((roll, *key))
+            if len(self._pending) >= self.flush_size:
+                self._wake.set()
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run, name="attendance-flush", daemon=True)
+                self._thread.start()
+        return True
+
+    def flush(self):
+        """Write all pending marks in one transaction; returns the number written."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return 0
+            try:
+                written = self._write(pending)
+            except sqlite3.Error as e:
+                logging.error("Attendance flush of %d mark(s) failed, will retry: %s", len(pending), e)
+                with self._lock:
+                    self._pending[:0] = pending
+                return 0
+            self.writes += written
+            self.flushes += 1
+            return written
+
+    @retry_on_busy
+    def _write(self, pending):
+        conn = get_connection(self.db_path)
+        try:
+            with conn:
+                written = 0
+                for roll, course_id, date in pending:
+                    if conn.execute(MARK_PRESENT, (course_id, date, roll)).rowcount:
+                        written += 1
+                    else:
+                        logging.warning("Student with roll %s not found!", roll)
+            return written
+        finally:
+            conn.close()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        """Stop the flush thread and write what is still pending."""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {"marks": self.marks, "skipped": self.skipped, "writes": self.writes,
+                "flushes": self.flushes, "pending": pending}
+
+
+_buffer = None
+_buffer_pid = None
+_buffer_lock = threading.Lock()
+
+
+def get_attendance_buffer(db_path="attendance.db"):
+    """The AttendanceBuffer of this process, created on first use and flushed at exit."""
+    global _buffer, _buffer_pid
+    with _buffer_lock:
+        # A forked child starts its own buffer; the parent's flush thread does not exist there
+        if _buffer is None or _buffer_pid != os.getpid():
+            _buffer, _buffer_pid = AttendanceBuffer(db_path), os.getpid()
+        return _buffer
+
+
+def flush_attendance():
+    """Write the pending marks of this process now (shutdown hooks, end of a video)."""
+    if _buffer is not None and _buffer_pid == os.getpid():
+        return _buffer.flush()
+    return 0
+
+
+@atexit.register
+def _close_at_exit():
+    if _buffer is not None and _buffer_pid == os.getpid():
+        _buffer.close()
@@ -1,17 +1,30 @@
 import sys
 import dlib
-import numpy as np
 import cv2
 import os
-import pandas as pd
 import time
 import logging
-import sqlite3
 import datetime
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 
+from attendance_buffer import flush_attendance, get_attendance_buffer
+from db import DB_PATH, get_connection, retry_on_busy
+from face_detection import create_detector
+from face_gallery import FEATURES_CSV_PATH, GALLERY_PATH
+from frame_pipeline import LatestQueue, run_stage
+from migrations import migrate
+from face_tracking import DETECT_INTERVAL, FULL_SWEEP_INTERVAL, CentroidTracker, CorrelationFaceTracker
+from recognition_engine import GalleryWatcher
 
-# Dlib  / Use frontal face detector of Dlib
-detector = dlib.get_frontal_face_detector()
+#  Frames per second of video looked at when processing recorded lectures
+VIDEO_SAMPLE_FPS = float(os.environ.get("VIDEO_SAMPLE_FPS", 2))
+
+
+# Face detector of the configured backend (Dlib HOG at native resolution by default)
+detector = create_detector(mode="native")
 
 # Dlib landmark / Get face landmarks
 predictor = dlib.shape_predictor(r"data/data_dlib/shape_predictor_68_face_landmarks.dat")
@@ -19,14 +32,32 @@ face_reco_model = dlib.face_recognition_model_v1(r"data/data_dlib/dlib_face_reco
 
 
 class Face_Recognizer:
-    def __init__(self, course_id):
-        # Initialize course ID
+    def __init__(self, course_id, detect_interval=DETECT_INTERVAL, full_sweep_interval=FULL_SWEEP_INTERVAL,
+                 date=None):
+        # Initialize course ID and the attendance date ('YYYY-MM-DD', today if not given)
         self.course_id = course_id
+        self.date = date
+
+        # Detector, run every detect_interval frames with correlation tracking in between and
+        # only around the known faces except for a full-frame sweep every full_sweep_interval frames
+        self.face_source = CorrelationFaceTracker(detector, detect_interval, full_sweep_interval=full_sweep_interval)
+        self.detector_calls_last_second = 0
+        self.detections_per_second = 0
+
+        # Rolls recognized by the pipeline threads, written to the DB by the display thread
+        self.attendance_queue = queue.Queue()
+        self.stop_event = threading.Event()
+        self.frames = self.detections = self.annotated = None
+        self.pipeline_started = time.monotonic()
+        self.lag = 0.0
+        self.lag_avg = None
 
         # Initialize face recognition-related attributes
         self.face_roll_number_known_list = []  # For roll numbers
         self.face_name_known_list = []         # For names
         self.face_features_known_list = []     # For features
+        self.gallery = None                    # FaceGallery holding the features as one matrix
+        self.gallery_watcher = None            # Reloads the gallery when it changes on disk
 
         # FPS and frame-related attributes
         self.frame_time = 0
@@ -39,6 +70,7 @@ class Face_Recognizer:
         self.frame_cnt = 0
         self.last_frame_face_centroid_list = []
         self.current_frame_face_centroid_list = []
+        self.current_frame_face_width_list = []
         self.last_frame_face_name_list = []
         self.current_frame_face_name_list = []
         self.last_frame_face_cnt = 0
@@ -46,94 +78,71 @@ class Face_Recognizer:
         self.current_frame_face_X_e_distance_list = []
         self.current_frame_face_position_list = []
         self.current_frame_face_feature_list = []
-        self.last_current_frame_centroid_e_distance = 0
+        self.tracker = CentroidTracker()       # Carries names from frame to frame
         self.reclassify_interval_cnt = 0
         self.reclassify_interval = 10
 
         # Add this line to initialize the font
         self.font = cv2.FONT_HERSHEY_SIMPLEX
 
+    def attendance_date(self):
+        return self.date or datetime.datetime.now().strftime('%Y-%m-%d')
+
     def prepopulate_attendance(self):
         """Insert default 'absent' entries for all students in the course"""
-        current_date = datetime.datetime.now().strftime('%Y-%m-%d')
-        conn = sqlite3.connect("attendance.db")
-        cursor = conn.cursor()
-        
-        # Get all students
-        cursor.execute("SELECT id FROM students")
-        students = cursor.fetchall()
-        
-        for student in students:
-            student_id = student[0]
-            # Check if entry exists
-            cursor.execute("""
-                SELECT * FROM attendance 
-                WHERE student_id = ? AND course_id = ? AND date = ?
-            """, (student_id, self.course_id, current_date))
-            
-            if not cursor.fetchone():
-                # Insert default 'absent' entry
-                cursor.execute("""
-                    INSERT INTO attendance (student_id, course_id, date, present)
-                    VALUES (?, ?, ?, 0)
-                """, (student_id, self.course_id, current_date))
-        
-        conn.commit()
-        conn.close()
-
-    #  "features_all.csv"  / Get known faces from "features_all.csv"
+        current_date = self.attendance_date()
+        migrate(DB_PATH)
+        self._insert_absent(current_date)
+
+    @retry_on_busy
+    def _insert_absent(self, current_date):
+        conn = get_connection(DB_PATH)
+        try:
+            # One statement for all students; rows that already exist are kept as they are
+            with conn:
+                conn.execute("""
+                    INSERT OR IGNORE INTO attendance (student_id, course_id, date, present)
+                    SELECT id, ?, ?, 0 FROM students
+                """, (self.course_id, current_date))
+        finally:
+            conn.close()
+
+    #  Get known faces from the binary gallery (or the legacy "features_all.csv")
     def get_face_database(self):
-        if os.path.exists("data/features_all.csv"):
-            path_features_known_csv = "data/features_all.csv"
-            csv_rd = pd.read_csv(path_features_known_csv, header=None)
-            for row in csv_rd.to_numpy():
-                roll_number = row[0]  # First column is roll number
-                name = row[1]        # Second column is name
-                features = row[2:].astype(float).tolist()  # Convert to floats here
-                self.face_roll_number_known_list.append(roll_number)
-                self.face_name_known_list.append(name)
-                self.face_features_known_list.append(features)
-            logging.info("Faces in Database: %d", len(self.face_features_known_list))
+        if os.path.exists(GALLERY_PATH) or os.path.exists(FEATURES_CSV_PATH):
+            self.gallery_watcher = GalleryWatcher()
+            self._sync_gallery()
             return 1
         else:
-            logging.warning("'features_all.csv' not found!")
-            logging.warning("Please run 'get_faces_from_camera.py' and 'features_extraction_to_csv.py' before 'face_reco_from_camera.py'")
+            logging.warning("'%s' not found!", GALLERY_PATH)
+            logging.warning("Please register faces and run 'features_extraction_to_csv.py' before 'attendance_taker.py'")
             return 0
 
+    def _sync_gallery(self):
+        """Pick up a newer gallery generation written by a registration during the session."""
+        self.gallery = self.gallery_watcher.current()
+        self.face_roll_number_known_list = self.gallery.rolls
+        self.face_name_known_list = self.gallery.names
+        self.face_features_known_list = self.gallery.features
+
     def update_fps(self):
         now = time.time()
         # Refresh fps per second
         if str(self.start_time).split(".")[0] != str(now).split(".")[0]:
             self.fps_show = self.fps
+            self.detections_per_second = self.face_source.detector_calls - self.detector_calls_last_second
+            self.detector_calls_last_second = self.face_source.detector_calls
         self.start_time = now
         self.frame_time = now - self.frame_start_time
         self.fps = 1.0 / self.frame_time
         self.frame_start_time = now
 
-    @staticmethod
-    # / Compute the e-distance between two 128D features
-    def return_euclidean_distance(feature_1, feature_2):
-        # Convert inputs to numpy arrays of float64
-        feature_1 = np.array(feature_1, dtype=np.float64)
-        feature_2 = np.array(feature_2, dtype=np.float64)
-        dist = np.linalg.norm(feature_1 - feature_2)  # Simplified distance calculation
-        return dist
-
-    # / Use centroid tracker to link face_x in current frame with person_x in last frame
+    # / Use centroid tracker to link face_x in current frame with person_x in earlier frames
     def centroid_tracker(self):
-        for i in range(len(self.current_frame_face_centroid_list)):
-            e_distance_current_frame_person_x_list = []
-            #  For object 1 in current_frame, compute e-distance with object 1/2/3/4/... in last frame
-            for j in range(len(self.last_frame_face_centroid_list)):
-                self.last_current_frame_centroid_e_distance = self.return_euclidean_distance(
-                    self.current_frame_face_centroid_list[i], self.last_frame_face_centroid_list[j])
-
-                e_distance_current_frame_person_x_list.append(
-                    self.last_current_frame_centroid_e_distance)
-
-            last_frame_num = e_distance_current_frame_person_x_list.index(
-                min(e_distance_current_frame_person_x_list))
-            self.current_frame_face_name_list[i] = self.last_frame_face_name_list[last_frame_num]
+        #  One distance matrix for all faces and tracks, solved as an optimal assignment so two
+        #  faces never take the same name; faces too far from every track become "unknown"
+        self.current_frame_face_name_list = self.tracker.update(
+            self.current_frame_face_centroid_list, self.current_frame_face_width_list)
 
     #  cv2 window / putText on cv2 window
     def draw_note(self, img_rd):
@@ -145,6 +154,10 @@ class Face_Recognizer:
                     cv2.LINE_AA)
         cv2.putText(img_rd, "Faces:  " + str(self.current_frame_face_cnt), (20, 160), self.font, 0.8, (0, 255, 0), 1,
                     cv2.LINE_AA)
+        cv2.putText(img_rd, "Det/s:  " + str(self.detections_per_second), (20, 190), self.font, 0.8, (0, 255, 0), 1,
+                    cv2.LINE_AA)
+        cv2.putText(img_rd, "Scan:   " + f"{self.face_source.scan_ratio:.0%}", (20, 220), self.font, 0.8, (0, 255, 0), 1,
+                    cv2.LINE_AA)
         cv2.putText(img_rd, "Q: Quit", (20, 450), self.font, 0.8, (255, 255, 255), 1, cv2.LINE_AA)
 
         for i in range(len(self.current_frame_face_name_list)):
@@ -157,56 +170,187 @@ class Face_Recognizer:
     # insert data in database
 
     def attendance(self, roll_number):
-        """Mark student as present for the course and date"""
-        current_date = datetime.datetime.now().strftime('%Y-%m-%d')
-        conn = sqlite3.connect("attendance.db")
-        cursor = conn.cursor()
-        
-        # Get student ID from roll number
-        cursor.execute("SELECT id FROM students WHERE roll_number = ?", (roll_number,))
-        student = cursor.fetchone()
-        
-        if not student:
-            print(f"Student with roll {roll_number} not found!")
-            conn.close()
-            return
-        
-        student_id = student[0]
-        # Update attendance to present
-        cursor.execute("""
-            UPDATE attendance 
-            SET present = 1 
-            WHERE student_id = ? AND course_id = ? AND date = ?
-        """, (student_id, self.course_id, current_date))
-        
-        conn.commit()
-        print(f"Marked present: Roll {roll_number}, Course {self.course_id}")
-        conn.close()
+        """Mark student as present for the course and date
+
+        Students already marked are skipped in memory; new marks are written to the DB in
+        batches by the attendance buffer.
+        """
+        if get_attendance_buffer(DB_PATH).mark(roll_number, self.course_id, self.attendance_date()):
+            print(f"Marked present: Roll {roll_number}, Course {self.course_id}")
+            return True
+        return False
 
     #  Face detection and recognition wit OT from input video stream
-    def process(self, stream):
+    #  Runs as a pipeline: capture thread -> detection thread -> recognition thread -> this
+    #  thread, which shows the frames and writes attendance. Stages hand over through
+    #  latest-frame-wins queues, so the camera keeps being read while the models run.
+    def process(self, stream, display=True, window_name="camera", stats_callback=None, stats_interval=5.0):
+        """Run the pipeline on ``stream`` until it ends (or 'q' is pressed in the window).
+
+        With ``display`` off nothing is drawn on screen. ``stats_callback`` is called with
+        pipeline_stats() every ``stats_interval`` seconds and once at the end.
+        """
         self.prepopulate_attendance()
         if not self.get_face_database():
             return
-        while stream.isOpened():
-            self.frame_cnt += 1
-            logging.debug("Frame %d starts", self.frame_cnt)
-            flag, img_rd = stream.read()
-            kk = cv2.waitKey(1)
-            faces = detector(img_rd, 0)
-
-            self._update_face_counts(faces)
-            if self._no_face_count_change():
-                img_rd = self._handle_no_face_count_change(img_rd, faces)
-            else:
-                img_rd = self._handle_face_count_change(img_rd, faces)
-
-            if kk == ord('q'):
-                break
-            self.update_fps()
-            cv2.namedWindow("camera", 1)
-            cv2.imshow("camera", img_rd)
-            logging.debug("Frame ends\n\n")
+        self.stop_event.clear()
+        self.pipeline_started = time.monotonic()
+        self.frames, self.detections, self.annotated = LatestQueue(), LatestQueue(), LatestQueue()
+        threads = [
+            threading.Thread(target=self._capture, args=(stream, self.frames), name="capture", daemon=True),
+            threading.Thread(target=run_stage, args=(self.frames, self.detections, self._detect_stage, self.stop_event),
+                             name="detection", daemon=True),
+            threading.Thread(target=run_stage, args=(self.detections, self.annotated, self._recognize_stage,
+                                                     self.stop_event), name="recognition", daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        if display:
+            cv2.namedWindow(window_name, 1)
+        next_stats = time.monotonic() + stats_interval
+        try:
+            while True:
+                item = self.annotated.get(timeout=0.03)
+                self._write_attendance()
+                if item is not None:
+                    captured_at, img_rd = item
+                    self._record_lag(time.monotonic() - captured_at)
+                    if display:
+                        cv2.imshow(window_name, img_rd)
+                elif self.annotated.closed:
+                    break
+                if display and cv2.waitKey(1) == ord('q'):
+                    break
+                if stats_callback and time.monotonic() >= next_stats:
+                    next_stats = time.monotonic() + stats_interval
+                    stats_callback(self.pipeline_stats())
+        finally:
+            self.stop_event.set()
+            for thread in threads:
+                thread.join(timeout=2)
+            self._write_attendance()
+            flush_attendance()
+        stats = self.pipeline_stats()
+        if stats_callback:
+            stats_callback(stats)
+        logging.info("Frames captured: %d, dropped before detection: %d, before recognition: %d, before display: %d",
+                     stats["captured"], self.frames.dropped, self.detections.dropped, self.annotated.dropped)
+
+    #  Headless processing of a recorded video: every sampled frame goes through detection and
+    #  recognition in this thread (nothing is dropped, nothing is shown), and the frames in
+    #  between are only grabbed, not decoded
+    def process_video(self, path, sample_fps=VIDEO_SAMPLE_FPS):
+        """Mark attendance from the video file at ``path``; returns throughput stats.
+
+        Attendance rows for the date must already exist (prepopulate_attendance()).
+        """
+        if not self.get_face_database():
+            return {"video": path, "error": "no face database"}
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            logging.error("Could not open video %s", path)
+            return {"video": path, "error": "could not open video"}
+        video_fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        step = max(1, round(video_fps / sample_fps)) if sample_fps > 0 else 1
+        marked = set()
+        frames = sampled = 0
+        started = time.monotonic()
+        try:
+            while cap.grab():
+                frames += 1
+                if (frames - 1) % step:
+                    continue
+                ok, img_rd = cap.retrieve()
+                if not ok:
+                    continue
+                sampled += 1
+                self._recognize_stage(self._detect_stage((time.monotonic(), img_rd)))
+                self._mark_new(marked)
+        finally:
+            cap.release()
+            # Pool workers do not run atexit handlers
+            flush_attendance()
+        elapsed = max(time.monotonic() - started, 1e-6)
+        stats = {
+            "video": path,
+            "frames": frames,
+            "sampled": sampled,
+            "seconds": round(elapsed, 2),
+            "fps": round(frames / elapsed, 1),
+            "sampled_fps": round(sampled / elapsed, 1),
+            "realtime_factor": round(frames / video_fps / elapsed, 1),
+            "present": sorted(marked),
+        }
+        logging.info("%s: %d frames (%d sampled) in %.1fs, %.1f frames/s, %.1fx real time, %d present",
+                     path, frames, sampled, elapsed, stats["fps"], stats["realtime_factor"], len(marked))
+        return stats
+
+    def _mark_new(self, marked):
+        #  A video shows the same students over and over; write each of them once
+        while True:
+            try:
+                roll_number = self.attendance_queue.get_nowait()
+            except queue.Empty:
+                return
+            if roll_number not in marked:
+                marked.add(roll_number)
+                self.attendance(roll_number)
+
+    def _capture(self, stream, frames):
+        try:
+            while not self.stop_event.is_set() and stream.isOpened():
+                flag, img_rd = stream.read()
+                if not flag:
+                    break
+                frames.put((time.monotonic(), img_rd))
+        finally:
+            frames.close()
+
+    def _detect_stage(self, item):
+        captured_at, img_rd = item
+        return captured_at, img_rd, self.face_source.detect(img_rd)
+
+    def _recognize_stage(self, item):
+        captured_at, img_rd, faces = item
+        self.frame_cnt += 1
+        logging.debug("Frame %d starts", self.frame_cnt)
+        self._update_face_counts(faces)
+        if self._no_face_count_change():
+            img_rd = self._handle_no_face_count_change(img_rd, faces)
+        else:
+            img_rd = self._handle_face_count_change(img_rd, faces)
+        self.update_fps()
+        logging.debug("Frame ends\n\n")
+        return captured_at, img_rd
+
+    def _record_lag(self, lag):
+        #  Capture-to-display latency: last value and an exponential moving average
+        self.lag = lag
+        self.lag_avg = lag if self.lag_avg is None else 0.9 * self.lag_avg + 0.1 * lag
+
+    def pipeline_stats(self):
+        """Frames captured/processed/dropped, processing FPS, detector calls and capture-to-output lag."""
+        elapsed = max(time.monotonic() - self.pipeline_started, 1e-6)
+        captured = self.frames.put_count if self.frames else 0
+        return {
+            "captured": captured,
+            "processed": self.frame_cnt,
+            "dropped": captured - self.frame_cnt,
+            "capture_fps": round(captured / elapsed, 1),
+            "fps": round(self.frame_cnt / elapsed, 1),
+            "detector_calls": self.face_source.detector_calls,
+            "scan_ratio": round(self.face_source.scan_ratio, 3),
+            "lag_ms": round(1000 * self.lag, 1),
+            "lag_avg_ms": round(1000 * (self.lag_avg or 0.0), 1),
+        }
+
+    def _write_attendance(self):
+        while True:
+            try:
+                roll_number = self.attendance_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.attendance(roll_number)
 
     def _update_face_counts(self, faces):
         self.last_frame_face_cnt = self.current_frame_face_cnt
@@ -214,6 +358,7 @@ class Face_Recognizer:
         self.last_frame_face_name_list = self.current_frame_face_name_list[:]
         self.last_frame_face_centroid_list = self.current_frame_face_centroid_list
         self.current_frame_face_centroid_list = []
+        self.current_frame_face_width_list = []
 
     def _no_face_count_change(self):
         return (self.current_frame_face_cnt == self.last_frame_face_cnt and self.reclassify_interval_cnt != self.reclassify_interval)
@@ -232,12 +377,12 @@ class Face_Recognizer:
                     int(faces[k].left() + faces[k].right()) / 2,
                     int(faces[k].top() + faces[k].bottom()) / 2
                 ])
+                self.current_frame_face_width_list.append(faces[k].right() - faces[k].left())
                 img_rd = cv2.rectangle(img_rd,
                                        tuple([d.left(), d.top()]),
                                        tuple([d.right(), d.bottom()]),
                                        (255, 255, 255), 2)
-        if self.current_frame_face_cnt != 1:
-            self.centroid_tracker()
+        self.centroid_tracker()
         for i in range(self.current_frame_face_cnt):
             img_rd = cv2.putText(img_rd, self.current_frame_face_name_list[i],
                                  self.current_frame_face_position_list[i], self.font, 0.8, (0, 255, 255), 1,
@@ -254,6 +399,7 @@ class Face_Recognizer:
         if self.current_frame_face_cnt == 0:
             logging.debug("  / No faces in this frame!!!")
             self.current_frame_face_name_list = []
+            self.tracker.update([], [])
             return img_rd
 
         logging.debug("  scene 2.2  Get faces in this frame and do face recognition")
@@ -271,35 +417,31 @@ class Face_Recognizer:
             self.current_frame_face_name_list.append("unknown")
 
     def _recognize_faces_and_update_attendance(self, faces):
+        self._sync_gallery()
+        # One batched search for every face in the frame against the whole gallery
+        distances, indices = self.gallery.search(self.current_frame_face_feature_list, k=1)
         for k in range(len(faces)):
             logging.debug("  For face %d in current frame:", k + 1)
             self.current_frame_face_centroid_list.append([
                 int(faces[k].left() + faces[k].right()) / 2,
                 int(faces[k].top() + faces[k].bottom()) / 2
             ])
-            self.current_frame_face_X_e_distance_list = []
+            self.current_frame_face_width_list.append(faces[k].right() - faces[k].left())
             self.current_frame_face_position_list.append(tuple([
                 faces[k].left(), int(faces[k].bottom() + (faces[k].bottom() - faces[k].top()) / 4)
             ]))
-            for i in range(len(self.face_features_known_list)):
-                if str(self.face_features_known_list[i][0]) != '0.0':
-                    e_distance_tmp = self.return_euclidean_distance(
-                        self.current_frame_face_feature_list[k],
-                        self.face_features_known_list[i])
-                    logging.debug("      with person %d, the e-distance: %f", i + 1, e_distance_tmp)
-                    self.current_frame_face_X_e_distance_list.append(e_distance_tmp)
-                else:
-                    self.current_frame_face_X_e_distance_list.append(999999999)
-            similar_person_num = self.current_frame_face_X_e_distance_list.index(
-                min(self.current_frame_face_X_e_distance_list))
-            if min(self.current_frame_face_X_e_distance_list) < 0.4:
+            if distances.shape[1] and distances[k, 0] < 0.4:
+                similar_person_num = indices[k, 0]
                 recognized_roll = self.face_roll_number_known_list[similar_person_num]
                 recognized_name = self.face_name_known_list[similar_person_num]
-                logging.debug("Recognized roll: %s", recognized_roll)
+                logging.debug("Recognized roll: %s, e-distance: %f", recognized_roll, distances[k, 0])
                 self.current_frame_face_name_list[k] = recognized_name
-                self.attendance(recognized_roll)
+                self.attendance_queue.put(recognized_roll)
             else:
                 logging.debug("Unknown person")
+        # Start the tracks from the fresh names
+        self.tracker.update(self.current_frame_face_centroid_list, self.current_frame_face_width_list,
+                            labels=self.current_frame_face_name_list)
 
     def run(self):
         cap = cv2.VideoCapture(0)             
@@ -309,14 +451,73 @@ class Face_Recognizer:
         cv2.destroyAllWindows()
 
 
+def _process_video_file(path, course_id, date, sample_fps):
+    return Face_Recognizer(course_id, detect_interval=1, date=date).process_video(path, sample_fps)
+
+
+def process_videos(course_id, paths, date=None, sample_fps=VIDEO_SAMPLE_FPS, workers=None):
+    """Mark attendance for ``course_id`` on ``date`` from recorded videos, several at a time.
+
+    Returns the per-video stats of Face_Recognizer.process_video() and the overall
+    throughput in frames per second.
+    """
+    date = date or datetime.datetime.now().strftime('%Y-%m-%d')
+    # Absent rows are created once here, not racing in every worker
+    Face_Recognizer(course_id, date=date).prepopulate_attendance()
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    started = time.monotonic()
+    # fork shares the Dlib models loaded at import with the workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+        results = list(pool.map(_process_video_file, paths, [course_id] * len(paths), [date] * len(paths),
+                                [sample_fps] * len(paths)))
+    elapsed = max(time.monotonic() - started, 1e-6)
+    frames = sum(r.get("frames", 0) for r in results)
+    logging.info("%d video(s) with %d worker(s): %d frames in %.1fs, %.1f frames/s",
+                 len(paths), workers, frames, elapsed, frames / elapsed)
+    return results, round(frames / elapsed, 1)
+
+
+def video_main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="attendance_taker.py video",
+                                     description="Take attendance from recorded lecture videos without a display")
+    parser.add_argument("course_id")
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--date", help="attendance date, YYYY-MM-DD (default: today)")
+    parser.add_argument("--sample-fps", type=float, default=VIDEO_SAMPLE_FPS,
+                        help="video frames per second to run recognition on (0: every frame)")
+    parser.add_argument("--workers", type=int, help="videos processed in parallel (default: CPU count)")
+    args = parser.parse_args(argv)
+    if args.date:
+        try:
+            datetime.datetime.strptime(args.date, '%Y-%m-%d')
+        except ValueError:
+            parser.error("--date must be YYYY-MM-DD")
+    results, fps = process_videos(args.course_id, args.videos, args.date, args.sample_fps, args.workers)
+    for result in results:
+        if "error" in result:
+            print(f"{result['video']}: {result['error']}")
+        else:
+            print(f"{result['video']}: {result['frames']} frames, {result['fps']} frames/s, "
+                  f"present: {', '.join(map(str, result['present'])) or '-'}")
+    print(f"Throughput: {fps} frames/s")
+    return 0 if all("error" not in r for r in results) else 1
+
+
 def main():
     logging.basicConfig(level=logging.INFO)
-    if len(sys.argv) != 2:
-        print("Usage: python attendance_taker.py <course_id>")
+    if len(sys.argv) >= 2 and sys.argv[1] == "video":
+        sys.exit(video_main(sys.argv[2:]))
+    if len(sys.argv) not in (2, 3, 4):
+        print("Usage: python attendance_taker.py <course_id> [detect_interval] [full_sweep_interval]")
+        print("       python attendance_taker.py video <course_id> <video> [<video> ...] "
+              "[--date YYYY-MM-DD] [--sample-fps N] [--workers N]")
         sys.exit(1)
 
     course_id = sys.argv[1]
-    recognizer = Face_Recognizer(course_id)  # Pass course_id here
+    detect_interval = int(sys.argv[2]) if len(sys.argv) >= 3 else DETECT_INTERVAL
+    full_sweep_interval = int(sys.argv[3]) if len(sys.argv) == 4 else FULL_SWEEP_INTERVAL
+    recognizer = Face_Recognizer(course_id, detect_interval, full_sweep_interval)  # Pass course_id here
     recognizer.run()
 
 if __name__ == '__main__':
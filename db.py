@@ -0,0 +1,95 @@
+# SQLite connections for attendance.db
+#
+# Each thread keeps one open connection per database file and gets it back on every
+# get_connection(), with the same pragmas everywhere: WAL so readers never block the
+# writer, synchronous=NORMAL (safe with WAL), a larger page cache, memory-mapped reads and
+# a busy timeout. Writes that still hit "database is locked" are retried with backoff.
+
+import functools
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+DB_PATH = "attendance.db"
+
+#  Milliseconds SQLite waits on a lock before giving up, page cache (KiB) and mmap size (bytes)
+BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", 16384))
+MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+
+#  Attempts of a write that fails with "database is locked", and the first backoff in seconds
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.05
+
+_local = threading.local()
+
+
+class PooledConnection(sqlite3.Connection):
+    """Connection reused by its thread; close() only ends the caller's transaction."""
+
+    def close(self):
+        # Leave no write lock behind for the next user of this connection
+        if self.in_transaction:
+            self.rollback()
+
+    def really_close(self):
+        super().close()
+
+
+def _configure(conn):
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = {-CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+
+
+def get_connection(db_path=DB_PATH):
+    """This thread's connection to ``db_path`` (rows as sqlite3.Row); call close() when done."""
+    pid = os.getpid()
+    # A forked child must not use the connections it inherited from its parent
+    if getattr(_local, "pid", None) != pid:
+        _local.pid, _local.connections = pid, {}
+    conn = _local.connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, factory=PooledConnection)
+        _configure(conn)
+        _local.connections[db_path] = conn
+    return conn
+
+
+def close_connections():
+    """Close this thread's connections (end of a thread, tests)."""
+    if getattr(_local, "pid", None) == os.getpid():
+        for conn in _local.connections.values():
+            conn.really_close()
+    _local.pid, _local.connections = os.getpid(), {}
+
+
+def is_busy_error(error):
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+def retry_on_busy(fn):
+    """Retry ``fn`` with exponential backoff and jitter while SQLite reports the database busy.
+
+    ``fn`` must be safe to run again: it should open its transaction itself and leave
+    nothing half-written when it raises.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        for attempt in range(RETRY_ATTEMPTS):
+            try:
+                return fn(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e) or attempt == RETRY_ATTEMPTS - 1:
+                    raise
+                delay = RETRY_BASE_DELAY * 2 ** attempt * (1 + random.random())
+                logging.warning("%s: %s, retrying in %.2fs", fn.__qualname__, e, delay)
+                time.sleep(delay)
+    return wrapper
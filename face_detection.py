@@ -0,0 +1,232 @@
+# Face detector backends (Dlib HOG, OpenCV Haar, OpenCV DNN) behind one interface, with
+# per-backend/mode latency and detection statistics
+#
+#   python face_detection.py benchmark [image_dir]   compare backends and modes on saved face images
+
+import abc
+import logging
+import os
+import sys
+import threading
+import time
+
+import cv2
+import dlib
+
+#  How the HOG detector is run on a frame:
+#    upsample   full resolution, upsampled once (most accurate, slowest)
+#    native     full resolution, no upsampling
+#    downscale  on a copy shrunk to DETECTION_MAX_WIDTH, upsampled only when nothing was found
+DETECTION_MODES = ("upsample", "native", "downscale")
+DEFAULT_DETECTION_MODE = os.environ.get("FACE_DETECTION_MODE", "upsample")
+DETECTION_MAX_WIDTH = int(os.environ.get("DETECTION_MAX_WIDTH", 320))
+
+#  Detector backend for this deployment: "dlib", "haar" or "dnn"
+DETECTOR_BACKENDS = ("dlib", "haar", "dnn")
+DEFAULT_DETECTOR_BACKEND = os.environ.get("FACE_DETECTOR_BACKEND", "dlib")
+#  Backend of the web app's registration capture, which has always used the Haar cascade
+CAPTURE_DETECTOR_BACKEND = os.environ.get("CAPTURE_DETECTOR_BACKEND", "haar")
+
+#  OpenCV DNN (YuNet) face detector model, run on the CPU
+DNN_MODEL_PATH = os.environ.get("DNN_MODEL_PATH", "data/data_opencv/face_detection_yunet_2023mar.onnx")
+DNN_CONFIDENCE = float(os.environ.get("DNN_CONFIDENCE", 0.6))
+
+
+def scale_rect(rect, scale, width, height):
+    """Map a rectangle found on a resized copy back to the original image coordinates."""
+    return dlib.rectangle(max(0, int(rect.left() / scale)), max(0, int(rect.top() / scale)),
+                          min(width - 1, int(rect.right() / scale)), min(height - 1, int(rect.bottom() / scale)))
+
+
+def detect_faces(detector, img_bgr, mode=DEFAULT_DETECTION_MODE, max_width=DETECTION_MAX_WIDTH):
+    """Run the HOG detector in the given mode and return rectangles in original coordinates.
+
+    Only detection looks at the downscaled copy; landmarks and descriptors are computed on
+    the full-resolution frame with the mapped-back rectangles.
+    """
+    if mode == "upsample":
+        return list(detector(img_bgr, 1))
+    if mode == "native":
+        return list(detector(img_bgr, 0))
+    if mode != "downscale":
+        raise ValueError(f"unknown detection mode '{mode}', expected one of {DETECTION_MODES}")
+
+    height, width = img_bgr.shape[:2]
+    if width <= max_width:
+        return list(detector(img_bgr, 0)) or list(detector(img_bgr, 1))
+    scale = max_width / width
+    small = cv2.resize(img_bgr, (max_width, int(round(height * scale))), interpolation=cv2.INTER_AREA)
+    faces = detector(small, 0)
+    if len(faces) == 0:
+        # Faces too small for the shrunk copy: upsample it once before giving up
+        faces = detector(small, 1)
+    return [scale_rect(face, scale, width, height) for face in faces]
+
+
+def find_cascade_file(cascade_filename='haarcascade_frontalface_default.xml'):
+    """Finds the Haar cascade next to the app or in OpenCV's bundled data."""
+    cascade_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), cascade_filename)
+    if not os.path.exists(cascade_path):
+        cascade_path = os.path.join(cv2.data.haarcascades, cascade_filename)
+        if not os.path.exists(cascade_path):
+            return None
+    return cascade_path
+
+
+class FaceDetector(abc.ABC):
+    """Common detector interface: detect() returns dlib.rectangle boxes in image coordinates."""
+
+    label = "base"
+
+    @abc.abstractmethod
+    def detect(self, img_bgr):
+        """Faces in a BGR image as dlib.rectangle boxes."""
+
+
+class DlibHogDetector(FaceDetector):
+    """Dlib's frontal HOG detector, run in one of DETECTION_MODES."""
+
+    def __init__(self, mode=DEFAULT_DETECTION_MODE, max_width=DETECTION_MAX_WIDTH):
+        if mode not in DETECTION_MODES:
+            raise ValueError(f"unknown detection mode '{mode}', expected one of {DETECTION_MODES}")
+        self.detector = dlib.get_frontal_face_detector()
+        self.mode = mode
+        self.max_width = max_width
+        self.label = f"dlib/{mode}"
+        # One detector object is shared by the request threads; it is not safe to run it
+        # concurrently, and HOG holds the GIL anyway, so the lock costs no parallelism
+        self._lock = threading.Lock()
+
+    def detect(self, img_bgr):
+        with self._lock:
+            return detect_faces(self.detector, img_bgr, mode=self.mode, max_width=self.max_width)
+
+
+class HaarDetector(FaceDetector):
+    """OpenCV Haar cascade; fastest, but more false positives than the other backends."""
+
+    label = "haar"
+
+    def __init__(self, cascade_path=None, scale_factor=1.1, min_neighbors=8, min_size=(40, 40)):
+        cascade_path = cascade_path or find_cascade_file()
+        if cascade_path is None:
+            raise FileNotFoundError("Haar cascade file not found")
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self._lock = threading.Lock()
+
+    def detect(self, img_bgr):
+        gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+        with self._lock:
+            boxes = self.cascade.detectMultiScale(gray, scaleFactor=self.scale_factor,
+                                                  minNeighbors=self.min_neighbors, minSize=self.min_size)
+        return [dlib.rectangle(int(x), int(y), int(x + w - 1), int(y + h - 1)) for x, y, w, h in boxes]
+
+
+class DnnDetector(FaceDetector):
+    """OpenCV DNN face detector (YuNet ONNX model) loaded from a local file and run on the CPU."""
+
+    label = "dnn"
+
+    def __init__(self, model_path=DNN_MODEL_PATH, confidence=DNN_CONFIDENCE):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"DNN face detector model '{model_path}' not found")
+        self.net = cv2.FaceDetectorYN.create(model_path, "", (320, 320), confidence, 0.3, 5000,
+                                             cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU)
+        # The detector holds its input size and blobs, so calls must not overlap
+        self._lock = threading.Lock()
+
+    def detect(self, img_bgr):
+        height, width = img_bgr.shape[:2]
+        with self._lock:
+            self.net.setInputSize((width, height))
+            _, detections = self.net.detect(img_bgr)
+        faces = []
+        for x, y, w, h in ([] if detections is None else detections[:, :4]):
+            left, top = max(0, int(x)), max(0, int(y))
+            right, bottom = min(width - 1, int(x + w)), min(height - 1, int(y + h))
+            if right > left and bottom > top:
+                faces.append(dlib.rectangle(left, top, right, bottom))
+        return faces
+
+
+def create_detector(backend=None, mode=DEFAULT_DETECTION_MODE):
+    """Create the configured detector backend; ``mode`` only applies to the Dlib backend."""
+    backend = backend or DEFAULT_DETECTOR_BACKEND
+    if backend == "dlib":
+        return DlibHogDetector(mode=mode)
+    if backend == "haar":
+        return HaarDetector()
+    if backend == "dnn":
+        return DnnDetector()
+    raise ValueError(f"unknown detector backend '{backend}', expected one of {DETECTOR_BACKENDS}")
+
+
+class DetectionStats:
+    """Latency and detection rate per backend/mode, accumulated over the life of a process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, label, seconds, face_count):
+        with self._lock:
+            entry = self._stats.setdefault(label, {"frames": 0, "frames_with_faces": 0, "faces": 0, "seconds": 0.0})
+            entry["frames"] += 1
+            entry["frames_with_faces"] += 1 if face_count else 0
+            entry["faces"] += face_count
+            entry["seconds"] += seconds
+
+    def summary(self):
+        """Per backend/mode: frames seen, mean latency in ms and share of frames with a face."""
+        with self._lock:
+            return {label: {"frames": e["frames"], "faces": e["faces"],
+                            "mean_ms": round(1000 * e["seconds"] / e["frames"], 2),
+                            "detection_rate": round(e["frames_with_faces"] / e["frames"], 3)}
+                    for label, e in self._stats.items()}
+
+
+def timed_detect(detector, img_bgr, stats):
+    """detector.detect() that also records the call in a DetectionStats."""
+    start = time.perf_counter()
+    faces = detector.detect(img_bgr)
+    stats.record(detector.label, time.perf_counter() - start, len(faces))
+    return faces
+
+
+def benchmark(image_dir, max_width=DETECTION_MAX_WIDTH):
+    """Print mean latency and detection rate of every backend/mode over the images in a directory tree."""
+    paths = [os.path.join(root, name) for root, _, files in os.walk(image_dir) for name in sorted(files)
+             if name.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    images = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+    if not images:
+        print(f"No images found in {image_dir}")
+        return
+    detectors = [DlibHogDetector(mode=mode, max_width=max_width) for mode in DETECTION_MODES]
+    for backend in ("haar", "dnn"):
+        try:
+            detectors.append(create_detector(backend))
+        except Exception as e:
+            print(f"Skipping '{backend}' backend: {e}")
+    stats = DetectionStats()
+    for detector in detectors:
+        for img in images:
+            timed_detect(detector, img, stats)
+    print(f"{len(images)} images from {image_dir}, max width {max_width}px for 'dlib/downscale'")
+    print(f"{'detector':>15} {'ms/frame':>9} {'detection rate':>15} {'faces':>6}")
+    for label, s in stats.summary().items():
+        print(f"{label:>15} {s['mean_ms']:>9.2f} {s['detection_rate']:>15.3f} {s['faces']:>6}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] != "benchmark":
+        print("Usage: python face_detection.py benchmark [image_dir]")
+        sys.exit(1)
+    benchmark(sys.argv[2] if len(sys.argv) > 2 else "data/data_faces_from_camera/")
+
+
+if __name__ == '__main__':
+    main()
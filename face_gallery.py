@@ -0,0 +1,191 @@
+# Known-face gallery stored as one contiguous float32 matrix with batched matching
+#
+# On disk the gallery is a small JSON manifest ("features_all.json") naming a float32 .npy
+# matrix and a roll/name .npy table of the same generation; both are opened with np.memmap
+# so every process shares the pages through the OS page cache.
+#
+#   python face_gallery.py convert [features_all.csv] [features_all.json]
+
+import glob
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+#  Length of a Dlib face descriptor
+FEATURE_DIM = 128
+
+#  Binary gallery manifest and the legacy CSV it replaces
+GALLERY_PATH = "data/features_all.json"
+FEATURES_CSV_PATH = "data/features_all.csv"
+
+
+class FaceGallery:
+    """Roll numbers, names and a (N, 128) float32 descriptor matrix of the known faces."""
+
+    def __init__(self, rolls, names, features):
+        # Memory-mapped label columns are kept as arrays so they are not copied per process
+        self.rolls = rolls if isinstance(rolls, np.ndarray) else list(rolls)
+        self.names = names if isinstance(names, np.ndarray) else list(names)
+        self.features = np.ascontiguousarray(np.asarray(features, dtype=np.float32).reshape(-1, FEATURE_DIM))
+        # Rows of zeros are written for people whose photos had no detectable face
+        self.valid = np.any(self.features != 0, axis=1)
+        self.sq_norms = np.einsum('ij,ij->i', self.features, self.features)
+        # Optional ann_index.IVFIndex used by search() instead of the exact scan
+        self.index = None
+        # Manifest generation for binary galleries, None when read from CSV
+        self.generation = None
+
+    @classmethod
+    def from_csv(cls, path):
+        """Load a gallery from "features_all.csv" (roll, name, 128 features per row)."""
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            logging.warning("'%s' not found, gallery is empty", path)
+            return cls([], [], np.empty((0, FEATURE_DIM), dtype=np.float32))
+        csv_rd = pd.read_csv(path, header=None, dtype={0: str, 1: str})
+        return cls(csv_rd[0].tolist(), csv_rd[1].tolist(), csv_rd.iloc[:, 2:].to_numpy(dtype=np.float32))
+
+    @classmethod
+    def from_binary(cls, manifest_path=GALLERY_PATH):
+        """Memory-map the gallery generation named by a manifest written by write_gallery()."""
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        base_dir = os.path.dirname(manifest_path)
+        features = np.load(os.path.join(base_dir, manifest["features"]), mmap_mode="r")
+        labels = np.load(os.path.join(base_dir, manifest["labels"]), mmap_mode="r")
+        if features.shape != (manifest["count"], FEATURE_DIM) or len(labels) != manifest["count"]:
+            raise ValueError(f"gallery files do not match manifest '{manifest_path}'")
+        gallery = cls(labels["roll"], labels["name"], features)
+        gallery.generation = manifest["generation"]
+        return gallery
+
+    def __len__(self):
+        return len(self.rolls)
+
+    def distances(self, probes):
+        """Return the (P, N) e-distance matrix between P probe descriptors and the gallery.
+
+        Uses |p - g|^2 = |p|^2 + |g|^2 - 2 p.g so all pairs come out of one matrix product;
+        invalid gallery rows get an infinite distance.
+        """
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, FEATURE_DIM)
+        sq_dist = (np.einsum('ij,ij->i', probes, probes)[:, None] + self.sq_norms[None, :]
+                   - 2.0 * (probes @ self.features.T))
+        dist = np.sqrt(np.maximum(sq_dist, 0.0))
+        dist[:, ~self.valid] = np.inf
+        return dist
+
+    def search(self, probes, k=1):
+        """Return ``(distances, indices)``, both (P, k), of the k nearest gallery faces per probe."""
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, FEATURE_DIM)
+        if self.index is not None:
+            return self.index.search(self, probes, k=k)
+        k = min(k, len(self))
+        if k == 0 or len(probes) == 0:
+            return np.empty((len(probes), 0), dtype=np.float32), np.empty((len(probes), 0), dtype=np.int64)
+        dist = self.distances(probes)
+        if k < dist.shape[1]:
+            idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            idx = np.broadcast_to(np.arange(dist.shape[1]), dist.shape).copy()
+        part = np.take_along_axis(dist, idx, axis=1)
+        order = np.argsort(part, axis=1)
+        return np.take_along_axis(part, order, axis=1), np.take_along_axis(idx, order, axis=1)
+
+
+def load_gallery(manifest_path=GALLERY_PATH, csv_path=FEATURES_CSV_PATH):
+    """Load the binary gallery, falling back to the legacy CSV for unconverted deployments."""
+    if os.path.exists(manifest_path):
+        return FaceGallery.from_binary(manifest_path)
+    if os.path.exists(csv_path):
+        logging.warning("Reading legacy '%s', run 'python face_gallery.py convert' to migrate", csv_path)
+    return FaceGallery.from_csv(csv_path)
+
+
+def write_gallery(rolls, names, features, manifest_path=GALLERY_PATH):
+    """Write a new gallery generation and atomically point the manifest at it.
+
+    Readers either see the old manifest and old files or the new ones. The previous
+    generation is kept, so a reader that has just read the old manifest can still open its
+    files; generations before that are removed.
+    """
+    features = np.ascontiguousarray(np.asarray(features, dtype=np.float32).reshape(-1, FEATURE_DIM))
+    rolls = [str(r) for r in rolls]
+    names = [str(n) for n in names]
+    labels = np.empty(len(rolls), dtype=[("roll", f"U{max(map(len, rolls), default=1)}"),
+                                         ("name", f"U{max(map(len, names), default=1)}")])
+    labels["roll"] = rolls
+    labels["name"] = names
+
+    base_dir = os.path.dirname(manifest_path)
+    stem = os.path.splitext(os.path.basename(manifest_path))[0]
+    generation = 1
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            generation = json.load(f)["generation"] + 1
+    features_name = f"{stem}.{generation}.npy"
+    labels_name = f"{stem}.{generation}.labels.npy"
+    np.save(os.path.join(base_dir, features_name), features)
+    np.save(os.path.join(base_dir, labels_name), labels)
+
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"generation": generation, "count": len(rolls), "dim": FEATURE_DIM,
+                   "features": features_name, "labels": labels_name}, f)
+    os.replace(tmp_path, manifest_path)
+
+    for old_path in glob.glob(os.path.join(base_dir, f"{stem}.*.npy")):
+        old_generation = os.path.basename(old_path)[len(stem) + 1:].split(".")[0]
+        if old_generation.isdigit() and int(old_generation) < generation - 1:
+            try:
+                os.remove(old_path)
+            except OSError:
+                # Still mapped by a running process on platforms that forbid it; cleaned up next time
+                logging.debug("Could not remove old gallery file %s", old_path)
+    return generation
+
+
+def convert_csv(csv_path=FEATURES_CSV_PATH, manifest_path=GALLERY_PATH):
+    """Convert a legacy "features_all.csv" into the binary gallery format."""
+    gallery = FaceGallery.from_csv(csv_path)
+    generation = write_gallery(gallery.rolls, gallery.names, gallery.features, manifest_path)
+    logging.info("Converted %d faces from %s into %s (generation %d)",
+                 len(gallery), csv_path, manifest_path, generation)
+
+
+def memory_usage():
+    """Memory of this process in kB, split into shared and private pages where the OS allows.
+
+    On Linux ``pss_kb`` (proportional set size) is the fair per-worker figure: pages shared
+    with the other workers, such as the memory-mapped gallery and preloaded models, are
+    divided between them.
+    """
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"):
+                    usage[key.lower() + "_kb"] = int(value.split()[0])
+    except OSError:
+        try:
+            import resource
+            usage["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        except ImportError:
+            pass
+    return usage
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] != "convert" or len(sys.argv) > 4:
+        print("Usage: python face_gallery.py convert [features_all.csv] [features_all.json]")
+        sys.exit(1)
+    convert_csv(*sys.argv[2:])
+
+
+if __name__ == '__main__':
+    main()
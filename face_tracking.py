@@ -0,0 +1,407 @@
+# Per-camera-session face tracking for the recognition API
+#
+# Browser clients send a session id with every snapshot. Faces that line up with a track
+# confirmed on an earlier snapshot of the same session keep that track's identity, so the
+# landmark + ResNet descriptor step only runs for new, unknown or borderline faces and for
+# a periodic re-check of confirmed ones.
+#
+# The desktop loop (attendance_taker.py) uses CentroidTracker to carry names between frames
+# and CorrelationFaceTracker to skip the detector on intermediate frames.
+
+import os
+import threading
+import time
+
+import dlib
+import numpy as np
+
+from face_detection import FaceDetector
+
+#  A face continues a track when its centre moved less than this fraction of the face width
+TRACK_GATE_RATIO = float(os.environ.get("TRACK_GATE_RATIO", 0.5))
+
+#  Tracks not seen for this many seconds are dropped. Only snapshots at (near) frame rate
+#  keep a track alive: manual snapshots seconds apart may show the next person standing in
+#  the same spot, so their faces always get a fresh descriptor
+TRACK_MAX_AGE = float(os.environ.get("TRACK_MAX_AGE", 0.5))
+
+#  Matches at or above this distance (still under the match threshold) are re-checked every time
+CONFIDENT_DISTANCE = float(os.environ.get("TRACK_CONFIDENT_DISTANCE", 0.35))
+
+#  Confirmed tracks are re-embedded every this many snapshots anyway
+RECLASSIFY_INTERVAL = int(os.environ.get("TRACK_RECLASSIFY_INTERVAL", 10))
+
+#  Sessions idle for this many seconds are forgotten
+SESSION_TTL = float(os.environ.get("TRACK_SESSION_TTL", 300))
+
+#  Desktop loop: run the detector every this many frames (1 = every frame, no correlation tracking)
+DETECT_INTERVAL = int(os.environ.get("DETECT_INTERVAL", 1))
+
+#  A correlation tracker whose peak-to-sidelobe ratio drops below this has lost its face
+MIN_TRACKING_PSR = float(os.environ.get("MIN_TRACKING_PSR", 7.0))
+
+#  Desktop loop: detections between full-frame sweeps only search around the known faces,
+#  enlarged by ROI_MARGIN face widths on every side; 1 = always sweep the full frame
+FULL_SWEEP_INTERVAL = int(os.environ.get("FULL_SWEEP_INTERVAL", 1))
+ROI_MARGIN = float(os.environ.get("ROI_MARGIN", 0.75))
+
+
+def face_centroids(faces):
+    """(n, 2) float32 centres and (n,) widths of dlib rectangles."""
+    boxes = np.array([[f.left(), f.top(), f.right(), f.bottom()] for f in faces], dtype=np.float32).reshape(-1, 4)
+    return (boxes[:, :2] + boxes[:, 2:]) / 2.0, boxes[:, 2] - boxes[:, 0]
+
+
+def centroid_distances(a, b):
+    """(len(a), len(b)) Euclidean distance matrix between two sets of 2D points, in one step."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 2)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 2)
+    return np.sqrt(np.maximum(np.einsum('ij,ij->i', a, a)[:, None] + np.einsum('ij,ij->i', b, b)[None, :]
+                              - 2.0 * (a @ b.T), 0.0))
+
+
+def linear_assignment(cost):
+    """Minimum-cost assignment of a rectangular cost matrix (Hungarian method, O(n^2 m)).
+
+    Returns ``(rows, cols)`` of the chosen pairs; every row is assigned when there are at
+    least as many columns, otherwise every column. The inner step over the columns is
+    vectorized; the cost grows with the cube of the face count and is small next to the
+    descriptor work it saves.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    # Row potentials u, column potentials v; owner[j] is the 1-based row matched to column j,
+    # column 0 is the virtual start of the augmenting path
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            reduced = cost[owner[j0] - 1] - u[owner[j0]] - v[1:]
+            free = ~used[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            slack = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(slack)) + 1
+            delta = slack[j1 - 1]
+            used_cols = np.flatnonzero(used)
+            u[owner[used_cols]] += delta
+            v[used_cols] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        # Flip the augmenting path back to the start
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    cols = np.flatnonzero(owner[1:])
+    rows = owner[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def assign(distances, gates):
+    """Optimal detection-to-track assignment with gating.
+
+    ``distances`` is (detections, tracks) and ``gates[t]`` the largest distance track ``t``
+    may be matched at; pairs beyond their gate are never matched. Returns the track index
+    of every detection, or -1 for a new face.
+    """
+    assigned = np.full(distances.shape[0], -1, dtype=np.int64)
+    if distances.size == 0:
+        return assigned
+    allowed = distances <= gates[None, :]
+    # Gated pairs get a cost no allowed combination can reach, and are dropped afterwards
+    cost = np.where(allowed, distances, distances.max() * distances.shape[0] + 1.0)
+    rows, cols = linear_assignment(cost)
+    keep = allowed[rows, cols]
+    assigned[rows[keep]] = cols[keep]
+    return assigned
+
+
+def associate(track_centroids, track_widths, centroids, gate_ratio=TRACK_GATE_RATIO):
+    """Pair detections with tracks gated to ``gate_ratio`` face widths of movement.
+
+    Returns ``assigned`` with the track index of every detection, or -1 for a new face.
+    """
+    gates = gate_ratio * np.maximum(np.asarray(track_widths, dtype=np.float32), 1.0)
+    return assign(centroid_distances(centroids, track_centroids), gates)
+
+
+class CentroidTracker:
+    """Frame-to-frame tracker for the desktop loop: labels follow faces by optimal assignment.
+
+    Tracks that find no detection are kept for ``max_missed`` frames, so a face hidden for a
+    frame or two gets its label back when it reappears.
+    """
+
+    def __init__(self, gate_ratio=TRACK_GATE_RATIO, max_missed=5):
+        self.gate_ratio = gate_ratio
+        self.max_missed = max_missed
+        self.centroids = np.empty((0, 2), dtype=np.float32)
+        self.widths = np.empty(0, dtype=np.float32)
+        self.labels = []
+        self.missed = np.empty(0, dtype=np.int64)
+
+    def update(self, centroids, widths, labels=None, unknown="unknown"):
+        """Match this frame's faces to the tracks and return the label of every face.
+
+        With ``labels`` (fresh recognition results) the matched tracks take the new labels;
+        otherwise faces inherit their track's label and new faces get ``unknown``.
+        """
+        centroids = np.asarray(centroids, dtype=np.float32).reshape(-1, 2)
+        widths = np.asarray(widths, dtype=np.float32).reshape(-1)
+        assigned = associate(self.centroids, self.widths, centroids, self.gate_ratio)
+        face_labels = list(labels) if labels is not None else [
+            self.labels[t] if t != -1 else unknown for t in assigned]
+
+        # Unmatched tracks age, matched ones are refreshed, new faces start tracks
+        matched = np.zeros(len(self.labels), dtype=bool)
+        matched[assigned[assigned != -1]] = True
+        self.missed = self.missed + 1
+        keep = ~matched & (self.missed <= self.max_missed)
+        self.centroids = np.concatenate([centroids, self.centroids[keep]])
+        self.widths = np.concatenate([widths, self.widths[keep]])
+        self.labels = face_labels + [label for label, k in zip(self.labels, keep) if k]
+        self.missed = np.concatenate([np.zeros(len(centroids), dtype=np.int64), self.missed[keep]])
+        return face_labels
+
+
+def face_rois(faces, width, height, margin=ROI_MARGIN):
+    """Search regions around faces, enlarged by ``margin`` face sizes, with overlaps merged.
+
+    Returns (left, top, right, bottom) tuples with exclusive right/bottom, clipped to the frame.
+    """
+    rois = []
+    for f in faces:
+        dx, dy = int(margin * f.width()), int(margin * f.height())
+        rois.append([max(0, f.left() - dx), max(0, f.top() - dy),
+                     min(width, f.right() + 1 + dx), min(height, f.bottom() + 1 + dy)])
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rois)):
+            for j in range(i + 1, len(rois)):
+                a, b = rois[i], rois[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rois[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del rois[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(r) for r in rois]
+
+
+class CorrelationFaceTracker(FaceDetector):
+    """Runs a detector every ``detect_interval`` frames and follows its faces in between.
+
+    Each detected face seeds a Dlib correlation tracker; on the frames in between only the
+    trackers are updated, which is much cheaper than a full-frame detection. A tracker whose
+    peak-to-sidelobe ratio drops under ``min_psr`` (face lost or occluded) forces a new
+    detection on that frame.
+
+    With ``full_sweep_interval`` > 1, detections only search enlarged regions around the
+    faces already known, and the whole frame is swept at most every ``full_sweep_interval``
+    frames (sooner when a region search loses a face or nothing is known) so new entrants
+    are still found. ``scan_ratio`` is the share of frame pixels the detector looked at.
+    """
+
+    def __init__(self, detector, detect_interval=DETECT_INTERVAL, min_psr=MIN_TRACKING_PSR,
+                 full_sweep_interval=FULL_SWEEP_INTERVAL, roi_margin=ROI_MARGIN):
+        self.detector = detector
+        self.detect_interval = max(1, detect_interval)
+        self.min_psr = min_psr
+        self.full_sweep_interval = max(1, full_sweep_interval)
+        self.roi_margin = roi_margin
+        self.trackers = []
+        self.last_faces = []
+        self.frames_since_detection = 0
+        self.frames_since_sweep = 0
+        self.detector_calls = 0
+        self.pixels_scanned = 0
+        self.pixels_full = 0
+        self.label = detector.label if self.detect_interval == 1 else f"{detector.label}+track/{self.detect_interval}"
+
+    @property
+    def scan_ratio(self):
+        """Pixels searched by the detector over the pixels of full-frame detections."""
+        return self.pixels_scanned / self.pixels_full if self.pixels_full else 1.0
+
+    def detect(self, img_bgr):
+        self.frames_since_detection += 1
+        self.frames_since_sweep += 1
+        if self.frames_since_detection < self.detect_interval:
+            faces = self._follow(img_bgr)
+            if faces is not None:
+                self.last_faces = faces
+                return faces
+        return self._redetect(img_bgr)
+
+    def _follow(self, img_bgr):
+        """Tracked face positions on this frame, or None when a tracker lost its face."""
+        height, width = img_bgr.shape[:2]
+        faces = []
+        for tracker in self.trackers:
+            if tracker.update(img_bgr) < self.min_psr:
+                return None
+            pos = tracker.get_position()
+            left, top = max(0, int(pos.left())), max(0, int(pos.top()))
+            right, bottom = min(width - 1, int(pos.right())), min(height - 1, int(pos.bottom()))
+            if right <= left or bottom <= top:
+                return None
+            faces.append(dlib.rectangle(left, top, right, bottom))
+        return faces
+
+    def _detect_in_rois(self, img_bgr):
+        """Faces found in the regions around the last known faces, in frame coordinates."""
+        height, width = img_bgr.shape[:2]
+        faces = []
+        for left, top, right, bottom in face_rois(self.last_faces, width, height, self.roi_margin):
+            self.pixels_scanned += (right - left) * (bottom - top)
+            # dlib misreads strided views, so hand it a contiguous copy of the crop
+            roi = np.ascontiguousarray(img_bgr[top:bottom, left:right])
+            for f in self.detector.detect(roi):
+                faces.append(dlib.rectangle(f.left() + left, f.top() + top, f.right() + left, f.bottom() + top))
+        return faces
+
+    def _redetect(self, img_bgr):
+        height, width = img_bgr.shape[:2]
+        self.detector_calls += 1
+        self.pixels_full += height * width
+        faces = None
+        if self.full_sweep_interval > 1 and self.last_faces and self.frames_since_sweep < self.full_sweep_interval:
+            faces = self._detect_in_rois(img_bgr)
+            if len(faces) < len(self.last_faces):
+                faces = None    # A face left its region: look at the whole frame
+        if faces is None:
+            faces = self.detector.detect(img_bgr)
+            self.pixels_scanned += height * width
+            self.frames_since_sweep = 0
+        self.last_faces = faces
+        self.frames_since_detection = 0
+        self.trackers = []
+        if self.detect_interval > 1:
+            for face in faces:
+                tracker = dlib.correlation_tracker()
+                tracker.start_track(img_bgr, face)
+                self.trackers.append(tracker)
+        return faces
+
+
+class Track:
+    """One face followed across the snapshots of a session."""
+
+    def __init__(self, track_id, centroid, width, now):
+        self.track_id = track_id
+        self.centroid = centroid
+        self.width = width
+        self.last_seen = now
+        self.match = None
+        self.top_k = 0                  # candidates requested when match was computed
+        self.since_embedding = 0
+
+    @property
+    def confirmed(self):
+        return (self.match is not None and self.match['distance'] is not None
+                and self.match['distance'] < CONFIDENT_DISTANCE)
+
+
+class SessionTracker:
+    """Tracks of one camera session and how many descriptor computations they saved."""
+
+    def __init__(self, reclassify_interval=RECLASSIFY_INTERVAL, max_age=TRACK_MAX_AGE):
+        self.reclassify_interval = reclassify_interval
+        self.max_age = max_age
+        self.tracks = []
+        self.next_track_id = 1
+        self.descriptors_computed = 0
+        self.descriptors_skipped = 0
+        self.last_used = time.monotonic()
+        # Snapshots of one session are processed one at a time
+        self.lock = threading.Lock()
+
+    def update(self, faces, now=None):
+        """Associate the detected faces with tracks and return the track of each face, in order."""
+        now = time.monotonic() if now is None else now
+        self.last_used = now
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age]
+        centroids, widths = face_centroids(faces)
+        assigned = associate(np.array([t.centroid for t in self.tracks], dtype=np.float32).reshape(-1, 2),
+                             np.array([t.width for t in self.tracks], dtype=np.float32), centroids)
+        tracks = []
+        for det, track_idx in enumerate(assigned):
+            if track_idx == -1:
+                track = Track(self.next_track_id, centroids[det], widths[det], now)
+                self.next_track_id += 1
+                self.tracks.append(track)
+            else:
+                track = self.tracks[track_idx]
+                track.centroid, track.width, track.last_seen = centroids[det], widths[det], now
+                track.since_embedding += 1
+            tracks.append(track)
+        return tracks
+
+    def needs_descriptor(self, track, top_k=1):
+        """New, unknown and borderline tracks are always embedded; confirmed ones periodically,
+        and whenever more candidates are asked for than the cached match holds."""
+        return (not track.confirmed or track.since_embedding >= self.reclassify_interval
+                or top_k > track.top_k)
+
+    def set_match(self, track, match, top_k=1):
+        track.match = match
+        track.top_k = top_k
+        track.since_embedding = 0
+
+    def record(self, computed, skipped):
+        self.descriptors_computed += computed
+        self.descriptors_skipped += skipped
+
+
+class SessionStore:
+    """SessionTracker per session id, forgetting sessions idle for longer than ``ttl`` seconds."""
+
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.expired_computed = 0
+        self.expired_skipped = 0
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, s in self._sessions.items() if now - s.last_used > self.ttl]:
+                expired = self._sessions.pop(key)
+                self.expired_computed += expired.descriptors_computed
+                self.expired_skipped += expired.descriptors_skipped
+            tracker = self._sessions.get(session_id)
+            if tracker is None:
+                tracker = self._sessions[session_id] = SessionTracker()
+            tracker.last_used = now
+            return tracker
+
+    def summary(self):
+        """Active sessions and descriptor computations run/avoided over the life of the process."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            computed = self.expired_computed + sum(s.descriptors_computed for s in sessions)
+            skipped = self.expired_skipped + sum(s.descriptors_skipped for s in sessions)
+        return {"active_sessions": len(sessions), "descriptors_computed": computed,
+                "descriptors_skipped": skipped}
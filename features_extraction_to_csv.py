@@ -1,17 +1,20 @@
-# Extract features from images and save into "features_all.csv"
+# Extract features from images and save them into the binary face gallery
 
 import os
 import dlib
-import csv
 import numpy as np
 import logging
 import cv2
 
+from ann_index import INDEX_PATH, MIN_INDEX_GALLERY, IVFIndex
+from face_detection import create_detector
+from face_gallery import FEATURE_DIM, load_gallery, write_gallery
+
 #  Path of cropped faces
 path_images_from_camera = "data/data_faces_from_camera/"
 
-#  Use frontal face detector of Dlib
-detector = dlib.get_frontal_face_detector()
+#  Face detector of the configured backend (Dlib HOG, upsampled once, by default)
+detector = create_detector(mode="upsample")
 
 #  Get face landmarks
 predictor = dlib.shape_predictor('data/data_dlib/shape_predictor_68_face_landmarks.dat')
@@ -26,7 +29,7 @@ def return_128d_features(path_img):
     img_rd = cv2.imread(path_img)
     if img_rd is None:
         return 0
-    faces = detector(img_rd, 1)
+    faces = detector.detect(img_rd)
 
     logging.info("%-40s %-20s", " Image with faces detected:", path_img)
 
@@ -69,25 +72,34 @@ def main():
     person_list = os.listdir(path_images_from_camera)
     person_list.sort()
 
-    with open("data/features_all.csv", "w", newline="") as csvfile:
-        writer = csv.writer(csvfile)
-        for person in person_list:
-            # Parse folder name
-            parts = person.split('_')
-            if len(parts) >= 5 and parts[2] == 'roll' and parts[4] == 'name':
-                roll = parts[3]
-                name = '_'.join(parts[5:])  # Handle names with underscores
-            else:
-                continue  # Skip invalid formats
-
-            # Get features
-            features_mean = return_features_mean_personX(os.path.join(path_images_from_camera, person))
-            
-            # Create CSV row: [Roll, Name, feature1, feature2, ..., feature128]
-            row = [roll, name] + features_mean.tolist()
-            writer.writerow(row)
-            
-            logging.info("Processed: Roll %s, Name %s", roll, name)
+    rolls, names, features = [], [], []
+    for person in person_list:
+        # Parse folder name
+        parts = person.split('_')
+        if len(parts) >= 5 and parts[2] == 'roll' and parts[4] == 'name':
+            roll = parts[3]
+            name = '_'.join(parts[5:])  # Handle names with underscores
+        else:
+            continue  # Skip invalid formats
+
+        # Get features
+        features_mean = return_features_mean_personX(os.path.join(path_images_from_camera, person))
+
+        rolls.append(roll)
+        names.append(name)
+        features.append(features_mean)
+
+        logging.info("Processed: Roll %s, Name %s", roll, name)
+
+    # Binary float32 matrix + roll/name table, memory-mapped by the recognizers
+    generation = write_gallery(rolls, names, np.array(features, dtype=np.float32).reshape(-1, FEATURE_DIM))
+    logging.info("Gallery generation %d written with %d faces", generation, len(rolls))
+
+    # Large galleries get an ANN index so recognition does not scan every face
+    gallery = load_gallery()
+    if len(gallery) >= MIN_INDEX_GALLERY:
+        IVFIndex.build(gallery).save(INDEX_PATH)
+        logging.info("ANN index rebuilt for %d faces", len(gallery))
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,72 @@
+# Building blocks for threaded frame pipelines (capture -> detection -> recognition -> sink)
+#
+# Stages hand frames over through single-slot latest-frame-wins queues: a slow stage makes
+# the one before it drop stale frames instead of blocking, so the camera is always read.
+
+import logging
+import threading
+
+
+class LatestQueue:
+    """Bounded (single slot) hand-off where put() replaces an item not yet taken."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._has_item = False
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item):
+        """Never blocks; an item the consumer has not taken yet is dropped."""
+        with self._cond:
+            if self._has_item:
+                self.dropped += 1
+            self._item, self._has_item = item, True
+            self.put_count += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """The newest item, or None on timeout or once the queue is closed and empty."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._has_item or self._closed, timeout)
+            if not self._has_item:
+                return None
+            item, self._item, self._has_item = self._item, None, False
+            return item
+
+    def close(self):
+        """Tell the consumer no more items will come."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        """True once closed and drained."""
+        with self._cond:
+            return self._closed and not self._has_item
+
+
+def run_stage(source, sink, fn, stop_event, poll_interval=0.1):
+    """Thread body of a stage: feed every item of ``source`` through ``fn`` into ``sink``.
+
+    Stops when ``stop_event`` is set or ``source`` is closed, and closes ``sink`` so the
+    next stage stops too. Results of None are not passed on.
+    """
+    try:
+        while not stop_event.is_set():
+            item = source.get(timeout=poll_interval)
+            if item is None:
+                if source.closed:
+                    break
+                continue
+            result = fn(item)
+            if result is not None:
+                sink.put(result)
+    except Exception:
+        logging.exception("Pipeline stage %s failed", threading.current_thread().name)
+        stop_event.set()
+    finally:
+        sink.close()
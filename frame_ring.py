@@ -0,0 +1,285 @@
+# Shared-memory ring buffer of fixed-size frames between a capture process and inference
+#
+# The capture process decodes each frame straight into the next slot (VideoCapture.read
+# into a NumPy view of the slot), so no frame is pickled or sent through a pipe on its
+# way between processes. Every slot carries the number of the frame it holds; a reader
+# compares it with the number it expects to tell when a slot was reused for a newer
+# frame while it was looking at it. RingStream copies each frame out of its slot once
+# and checks the number again after the copy, so inference and drawing never touch
+# memory the writer may be reusing.
+#
+#   python frame_ring.py benchmark [--frames N] [--width W] [--height H] [--slots S]
+
+import argparse
+import logging
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+#  Frame slots per ring; a frame handed to a reader stays valid until this many newer
+#  frames have been written
+RING_SLOTS = 16
+
+#  Slot sequence value while the writer is filling it
+WRITING = -1
+
+_HEADER_FIELDS = 2          # head (number of the next frame to write), closed flag
+_ALIGN = 64
+
+
+class FrameRing:
+    """Fixed-size frame slots in a multiprocessing.shared_memory block.
+
+    Layout: int64 head and closed flag, int64 frame number and float64 timestamp per slot,
+    then the frames themselves. Create it in one process (``create=True``) and attach to
+    it by ``name`` in the others.
+    """
+
+    def __init__(self, shape, slots=RING_SLOTS, name=None, create=False, dtype=np.uint8):
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.dtype = np.dtype(dtype)
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        header_bytes = 8 * (_HEADER_FIELDS + 2 * slots)
+        data_offset = -(-header_bytes // _ALIGN) * _ALIGN
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=data_offset + slots * frame_bytes)
+        self.name = self.shm.name
+        buf = self.shm.buf
+        self._header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=buf)
+        self._seq = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=8 * _HEADER_FIELDS)
+        self._stamps = np.ndarray((slots,), dtype=np.float64, buffer=buf, offset=8 * (_HEADER_FIELDS + slots))
+        self._frames = np.ndarray((slots, *self.shape), dtype=self.dtype, buffer=buf, offset=data_offset)
+        if create:
+            self._header[:] = 0
+            self._seq[:] = WRITING
+
+    @property
+    def head(self):
+        """Number of the next frame to be written (frames are numbered from 0)."""
+        return int(self._header[0])
+
+    @property
+    def closed(self):
+        return bool(self._header[1])
+
+    # --- writer side ---
+
+    def begin_write(self):
+        """Return ``(frame_no, view)`` of the slot for the next frame; fill it, then commit()."""
+        frame_no = self.head
+        slot = frame_no % self.slots
+        self._seq[slot] = WRITING
+        return frame_no, self._frames[slot]
+
+    def commit(self, frame_no, timestamp=None):
+        slot = frame_no % self.slots
+        self._stamps[slot] = time.monotonic() if timestamp is None else timestamp
+        self._seq[slot] = frame_no
+        self._header[0] = frame_no + 1
+
+    def write(self, frame):
+        """Copy a frame into the next slot; returns its frame number."""
+        frame_no, view = self.begin_write()
+        np.copyto(view, frame)
+        self.commit(frame_no)
+        return frame_no
+
+    def close(self):
+        """Mark the stream as ended for the readers."""
+        self._header[1] = 1
+
+    # --- reader side ---
+
+    def view(self, frame_no):
+        """Zero-copy ``(view, timestamp)`` of a frame, or None if its slot holds another frame."""
+        slot = frame_no % self.slots
+        if self._seq[slot] != frame_no:
+            return None
+        return self._frames[slot], float(self._stamps[slot])
+
+    def is_valid(self, frame_no):
+        """True while the slot of ``frame_no`` has not been reused for a newer frame."""
+        return self._seq[frame_no % self.slots] == frame_no
+
+    def read(self, frame_no):
+        """Copy of a frame, or None if it was overwritten before or during the copy."""
+        found = self.view(frame_no)
+        if found is None:
+            return None
+        frame = found[0].copy()
+        return frame if self.is_valid(frame_no) else None
+
+    def wait_for(self, after, timeout=None, poll_interval=0.001):
+        """Wait until a frame newer than ``after`` exists; returns the newest frame number or None."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            head = self.head
+            if head - 1 > after:
+                return head - 1
+            if self.closed or (deadline is not None and time.monotonic() >= deadline):
+                return None
+            time.sleep(poll_interval)
+
+    def release(self, unlink=False):
+        """Detach from the block; the creating process also unlinks it."""
+        del self._header, self._seq, self._stamps, self._frames
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class RingStream:
+    """cv2.VideoCapture-like reader of the newest frames in a FrameRing.
+
+    read() returns a private copy of the frame, taken and verified against the slot's
+    frame number before it is handed out; ``overwritten`` counts frames whose slot was
+    reused before or during that copy (they are skipped).
+    """
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.last_frame_no = -1
+        self.overwritten = 0
+
+    def isOpened(self):
+        return not (self.ring.closed and self.ring.head - 1 <= self.last_frame_no)
+
+    def read(self):
+        while True:
+            frame_no = self.ring.wait_for(self.last_frame_no)
+            if frame_no is None:
+                return False, None
+            self.last_frame_no = frame_no
+            frame = self.ring.read(frame_no)
+            if frame is not None:
+                return True, frame
+            self.overwritten += 1
+
+    def release(self):
+        pass
+
+
+def capture_to_ring(source, ring_name, shape, slots=RING_SLOTS, stop_event=None):
+    """Capture process body: decode frames of ``source`` straight into the ring's slots.
+
+    Stops at the end of the stream or once ``stop_event`` is set; closing the ring then
+    ends the reader's stream too.
+    """
+    ring = FrameRing(shape, slots, name=ring_name)
+    cap = cv2.VideoCapture(source)
+    try:
+        while cap.isOpened() and not (stop_event is not None and stop_event.is_set()):
+            frame_no, view = ring.begin_write()
+            ok, frame = cap.read(view)
+            if not ok:
+                break
+            if frame.shape != view.shape:
+                logging.warning("Stream %s changed frame size to %s, stopping", source, frame.shape)
+                break
+            if not np.shares_memory(frame, view):
+                np.copyto(view, frame)
+            ring.commit(frame_no)
+    finally:
+        ring.close()
+        cap.release()
+        ring.release()
+
+
+def probe_frame_shape(source):
+    """(height, width, 3) of a camera or video file, or None if it cannot be opened."""
+    cap = cv2.VideoCapture(source)
+    try:
+        if not cap.isOpened():
+            return None
+        width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if width <= 0 or height <= 0:
+            ok, frame = cap.read()
+            return frame.shape if ok else None
+        return height, width, 3
+    finally:
+        cap.release()
+
+
+def _produce_ring(ring_name, shape, slots, n_frames, consumed):
+    ring = FrameRing(shape, slots, name=ring_name)
+    frame = np.random.default_rng(0).integers(0, 255, size=shape, dtype=np.uint8)
+    for i in range(n_frames):
+        # Benchmark only: wait for the reader instead of overwriting unread slots
+        while i - consumed.value >= slots - 1:
+            time.sleep(0)
+        ring.write(frame)
+    ring.close()
+    ring.release()
+
+
+def _produce_queue(q, shape, n_frames):
+    frame = np.random.default_rng(0).integers(0, 255, size=shape, dtype=np.uint8)
+    for _ in range(n_frames):
+        q.put(frame)
+    q.put(None)
+
+
+def benchmark(n_frames=500, shape=(480, 640, 3), slots=RING_SLOTS):
+    """Frames/s moved from a producer process to this one by a FrameRing and a multiprocessing.Queue."""
+    ctx = multiprocessing.get_context("fork")
+    mb = np.prod(shape) / 1e6
+
+    ring = FrameRing(shape, slots, create=True)
+    consumed = ctx.Value("q", -1, lock=False)
+    producer = ctx.Process(target=_produce_ring, args=(ring.name, shape, slots, n_frames, consumed))
+    start = time.perf_counter()
+    producer.start()
+    received = lost = 0
+    next_frame = 0
+    while next_frame < n_frames:
+        if ring.wait_for(next_frame - 1, timeout=5) is None:
+            break
+        # Copy out and verify, as RingStream does before inference
+        frame = ring.read(next_frame)
+        if frame is None:
+            lost += 1
+        else:
+            int(frame[0, 0, 0])
+            received += 1
+        consumed.value = next_frame
+        next_frame += 1
+    ring_secs = time.perf_counter() - start
+    producer.join()
+    ring.release(unlink=True)
+
+    q = ctx.Queue(maxsize=slots)
+    producer = ctx.Process(target=_produce_queue, args=(q, shape, n_frames))
+    start = time.perf_counter()
+    producer.start()
+    queued = 0
+    while (frame := q.get()) is not None:
+        int(frame[0, 0, 0])
+        queued += 1
+    queue_secs = time.perf_counter() - start
+    producer.join()
+
+    print(f"{n_frames} frames of {shape[1]}x{shape[0]}x{shape[2]} ({mb:.2f} MB each), {slots} slots")
+    print(f"{'transport':>22} {'frames/s':>9} {'MB/s':>8} {'received':>9}")
+    print(f"{'shared-memory ring':>22} {received / ring_secs:>9.0f} {received * mb / ring_secs:>8.0f} {received:>9}"
+          f"  ({lost} overwritten)")
+    print(f"{'multiprocessing.Queue':>22} {queued / queue_secs:>9.0f} {queued * mb / queue_secs:>8.0f} {queued:>9}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Shared-memory frame ring buffer tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench_cmd = sub.add_parser("benchmark", help="compare with multiprocessing.Queue")
+    bench_cmd.add_argument("--frames", type=int, default=500)
+    bench_cmd.add_argument("--width", type=int, default=640)
+    bench_cmd.add_argument("--height", type=int, default=480)
+    bench_cmd.add_argument("--slots", type=int, default=RING_SLOTS)
+    args = parser.parse_args()
+    benchmark(args.frames, (args.height, args.width, 3), args.slots)
+
+
+if __name__ == '__main__':
+    main()
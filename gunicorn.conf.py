@@ -0,0 +1,33 @@
+# Gunicorn settings, picked up automatically by `gunicorn app:app`
+#
+# The app is imported once in the master before the workers are forked, so the Dlib models
+# and the memory-mapped face gallery are loaded a single time and their pages are shared
+# copy-on-write by every worker. Compare per-worker memory with GET /api/recognizer/stats
+# (or the "worker memory" log lines) with GUNICORN_PRELOAD=0 and =1.
+
+import logging
+import os
+
+from attendance_buffer import flush_attendance
+from face_gallery import memory_usage
+from recognition_jobs import WEB_WORKERS
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+workers = WEB_WORKERS
+# Threads per worker, so result long-polls of /api/recognition_jobs do not hold up other pages
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# app.py warms the recognition engine at import time when this is set
+if preload_app:
+    os.environ.setdefault("PRELOAD_RECOGNIZER", "1")
+
+
+def post_worker_init(worker):
+    logging.getLogger("gunicorn.error").info("worker %s memory after init: %s", worker.pid, memory_usage())
+
+
+def worker_exit(server, worker):
+    # Attendance marks still waiting in the worker's write-behind buffer
+    written = flush_attendance()
+    if written:
+        logging.getLogger("gunicorn.error").info("worker %s flushed %d attendance mark(s)", worker.pid, written)
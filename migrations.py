@@ -0,0 +1,271 @@
+# Versioned schema migrations for attendance.db
+#
+# PRAGMA user_version holds the number of migrations applied to a database; migrate()
+# applies the missing ones in order, each in the same transaction as its version bump.
+# The app runs it at startup, the desktop tools before a session. --check-plans runs
+# EXPLAIN QUERY PLAN on every branch of the report and lookup queries (report_queries.py)
+# and fails when one of them reads a table in full that it is not expected to.
+#
+#   python migrations.py [--db attendance.db] [--status | --rebuild-rollups | --check-plans]
+
+import argparse
+import logging
+import sqlite3
+import sys
+
+from report_queries import (ATTENDANCE_DATA_QUERY, ATTENDANCE_SUMMARY_QUERY, CLASSES_HELD_QUERY,
+                            CLASSES_WITH_PRESENCE_QUERY, COURSES_IN_SEMESTER_QUERY, attendance_trend_sql,
+                            build_date_filter_sql, course_stats_sql, low_attendance_query, overall_attendance_sql)
+
+DB_PATH = "attendance.db"
+
+
+def _unique_attendance(conn):
+    # Keep one row per (student, course, date), the present one if any duplicate was present
+    conn.execute("""
+        DELETE FROM attendance WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY student_id, course_id, date ORDER BY present DESC, id
+                ) AS n
+                FROM attendance
+            ) WHERE n > 1
+        )
+    """)
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_student_course_date
+        ON attendance (student_id, course_id, date)
+    """)
+
+
+def _report_indexes(conn):
+    # Covering indexes: the report queries read these columns only, never the table rows
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_attendance_course_date
+        ON attendance (course_id, date, student_id, present)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_attendance_date_course
+        ON attendance (date, course_id, student_id, present)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_attendance_student_course_present
+        ON attendance (student_id, course_id, present, date)
+    """)
+
+
+#  Keep a rollup row's counts in step with one attendance row being added (sign +1) or
+#  removed (sign -1); rows whose total drops to zero are deleted
+def _rollup_statements(row, sign):
+    statements = []
+    for table, key, value in (("attendance_daily", "date", f"{row}.date"),
+                              ("attendance_monthly", "month", f"substr({row}.date, 1, 7)")):
+        statements.append(f"""
+            INSERT INTO {table} ({key}, course_id, present, total)
+            VALUES ({value}, {row}.course_id, {sign} * {row}.present, {sign})
+            ON CONFLICT ({key}, course_id) DO UPDATE
+            SET present = present + excluded.present, total = total + excluded.total;""")
+        if sign < 0:
+            statements.append(f"""
+            DELETE FROM {table} WHERE {key} = {value} AND course_id = {row}.course_id AND total <= 0;""")
+    return "".join(statements)
+
+
+def rebuild_rollups(conn):
+    """Recompute attendance_daily and attendance_monthly from the attendance table."""
+    conn.execute("DELETE FROM attendance_daily")
+    conn.execute("DELETE FROM attendance_monthly")
+    conn.execute("""
+        INSERT INTO attendance_daily (date, course_id, present, total)
+        SELECT date, course_id, SUM(present), COUNT(*) FROM attendance GROUP BY date, course_id
+    """)
+    conn.execute("""
+        INSERT INTO attendance_monthly (month, course_id, present, total)
+        SELECT substr(date, 1, 7), course_id, SUM(present), SUM(total) FROM attendance_daily
+        GROUP BY substr(date, 1, 7), course_id
+    """)
+
+
+def _attendance_rollups(conn):
+    # Present/total counts per (date, course) and (month, course) for the reports, kept up
+    # to date by triggers on attendance so every write path maintains them
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_daily (
+            date TEXT NOT NULL,
+            course_id INTEGER NOT NULL,
+            present INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (date, course_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_monthly (
+            month TEXT NOT NULL,          -- 'YYYY-MM'
+            course_id INTEGER NOT NULL,
+            present INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (month, course_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_rollup_insert AFTER INSERT ON attendance
+        BEGIN {_rollup_statements("NEW", 1)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_rollup_delete AFTER DELETE ON attendance
+        BEGIN {_rollup_statements("OLD", -1)}
+        END
+    """)
+    # Upserts of a student already present rewrite the row unchanged; those need no work
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_rollup_update AFTER UPDATE OF date, course_id, present ON attendance
+        WHEN OLD.date IS NOT NEW.date OR OLD.course_id IS NOT NEW.course_id OR OLD.present IS NOT NEW.present
+        BEGIN {_rollup_statements("OLD", -1)}{_rollup_statements("NEW", 1)}
+        END
+    """)
+    rebuild_rollups(conn)
+
+
+def _recognition_jobs(conn):
+    # Asynchronous recognition jobs of recognition_jobs.JobQueue, shared by all web workers
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recognition_jobs (
+            id TEXT PRIMARY KEY,
+            course_id TEXT NOT NULL,
+            status TEXT NOT NULL,          -- 'queued', 'done' or 'error'
+            result TEXT,                   -- JSON list of matches when done
+            error TEXT,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recognition_jobs_status ON recognition_jobs (status, created_at)")
+
+
+#  (version, description, apply(conn)); append new migrations, never edit applied ones
+MIGRATIONS = [
+    (1, "one attendance row per student, course and date", _unique_attendance),
+    (2, "covering indexes for the attendance reports and lookups", _report_indexes),
+    (3, "daily and monthly attendance rollups maintained by triggers", _attendance_rollups),
+    (4, "recognition job table", _recognition_jobs),
+]
+
+#  Sample arguments for the plan checks
+_PERIOD = ("2025-01-01", "2025-06-30")
+_FILTER_SQL, _FILTER_PARAMS = build_date_filter_sql(*_PERIOD)
+
+#  (name, sql, params, scans) for every branch of the app.py report and lookup queries,
+#  built by the same report_queries functions the app calls. ``scans`` are the plan names
+#  (alias or table) a check may read in full; any other SCAN fails it. Unfiltered totals
+#  scan the monthly rollup, one row per month and course; the unfiltered low-attendance
+#  list walks all students and searches each one's rows by index.
+PLAN_CHECKS = [
+    ("dashboard summary", ATTENDANCE_SUMMARY_QUERY, (), {"attendance_monthly"}),
+    ("fetch_attendance_data", ATTENDANCE_DATA_QUERY, (_PERIOD[0], 1), set()),
+    ("fetch_attendance_counts: classes held", CLASSES_HELD_QUERY, (1, *_PERIOD), set()),
+    ("fetch_attendance_counts: present/absent", CLASSES_WITH_PRESENCE_QUERY, (1, 1, 1, *_PERIOD), set()),
+    ("fetch_courses_in_semester", COURSES_IN_SEMESTER_QUERY, _PERIOD, set()),
+    ("_calculate_overall_attendance: period", overall_attendance_sql(_FILTER_SQL), _FILTER_PARAMS, set()),
+    ("_calculate_overall_attendance: all time", overall_attendance_sql(""), (), {"a"}),
+    ("_calculate_course_stats: period", course_stats_sql(_FILTER_SQL), _FILTER_PARAMS, set()),
+    ("_calculate_course_stats: all time", course_stats_sql(""), (), {"a"}),
+    ("_calculate_attendance_trend: period", attendance_trend_sql(_FILTER_SQL), _FILTER_PARAMS, set()),
+    ("_calculate_attendance_trend: all time", attendance_trend_sql(""), (), {"attendance_monthly"}),
+    ("_calculate_low_attendance_students: period and course", *low_attendance_query(*_PERIOD, 1), set()),
+    ("_calculate_low_attendance_students: period", *low_attendance_query(*_PERIOD, None), set()),
+    ("_calculate_low_attendance_students: course", *low_attendance_query(None, None, 1), set()),
+    ("_calculate_low_attendance_students: all", *low_attendance_query(None, None, None), {"s"}),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db_path=DB_PATH):
+    """Apply the migrations ``db_path`` is missing; returns the versions applied."""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        if schema_version(conn) >= SCHEMA_VERSION:
+            return []
+        # IMMEDIATE takes the write lock first, so concurrently starting workers run this one at a time
+        conn.execute("BEGIN IMMEDIATE")
+        applied = []
+        try:
+            for version, description, apply in MIGRATIONS:
+                if version <= schema_version(conn):
+                    continue
+                logging.info("Applying migration %d: %s", version, description)
+                apply(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                applied.append(version)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return applied
+    finally:
+        conn.close()
+
+
+def check_plans(conn):
+    """[(name, plan lines, ok)] for PLAN_CHECKS; ok when only the check's allowed names are scanned."""
+    results = []
+    for name, sql, params, allowed in PLAN_CHECKS:
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        scans = [line for line in plan if line.startswith("SCAN ") and line.split()[1] not in allowed]
+        results.append((name, plan, not scans))
+    return results
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    parser = argparse.ArgumentParser(description="Bring the attendance database schema up to date")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--status", action="store_true", help="only print the schema version")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="migrate, then recompute the daily and monthly rollups from attendance")
+    parser.add_argument("--check-plans", action="store_true",
+                        help="migrate, then verify the attendance queries only scan the tables they are expected to")
+    args = parser.parse_args()
+    if args.status:
+        conn = sqlite3.connect(args.db)
+        try:
+            current = schema_version(conn)
+        finally:
+            conn.close()
+        print(f"{args.db}: schema version {current} of {SCHEMA_VERSION}")
+        for version, description, _ in MIGRATIONS:
+            print(f"  {version:3d} {'applied' if version <= current else 'pending':8s} {description}")
+        return
+    applied = migrate(args.db)
+    print(f"Applied migration(s) {', '.join(map(str, applied))}" if applied else "Schema is up to date")
+    if args.rebuild_rollups:
+        conn = sqlite3.connect(args.db, timeout=30)
+        try:
+            with conn:
+                rebuild_rollups(conn)
+            days, months = (conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                            for table in ("attendance_daily", "attendance_monthly"))
+        finally:
+            conn.close()
+        print(f"Rebuilt rollups: {days} (date, course) and {months} (month, course) rows")
+    if args.check_plans:
+        conn = sqlite3.connect(args.db)
+        try:
+            results = check_plans(conn)
+        finally:
+            conn.close()
+        for name, plan, ok in results:
+            print(f"{'ok  ' if ok else 'SCAN'} {name}")
+            for line in plan:
+                print(f"       {line}")
+        if not all(ok for _, _, ok in results):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
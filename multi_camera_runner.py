@@ -0,0 +1,195 @@
+# Run attendance on several cameras / video files at once, one worker process per stream
+#
+#   python multi_camera_runner.py 0=1 1=1 lectures/room3.mp4=2 [--display] [--stats-interval 5]
+#                                 [--shared-memory [--ring-slots N]]
+#
+# Each SOURCE=COURSE_ID pair is a camera index or video file and the course it records.
+# The models are loaded in this process before the workers are forked, and every worker
+# memory-maps the same binary gallery, so their pages are shared instead of copied.
+# With --shared-memory each stream is captured by a separate process that decodes frames
+# into a frame_ring.FrameRing; the inference worker copies each frame out of its slot once.
+# Ctrl-C asks the workers to stop and waits for them to flush their attendance marks.
+
+import argparse
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+
+import cv2
+
+import attendance_taker
+from frame_ring import RING_SLOTS, FrameRing, RingStream, capture_to_ring, probe_frame_shape
+
+#  Seconds the workers get to finish and flush after Ctrl-C before they are terminated
+STOP_TIMEOUT = 10.0
+
+
+def parse_streams(specs):
+    """[(source, course_id)] from "SOURCE=COURSE_ID" arguments; numeric sources are camera indices."""
+    streams = []
+    for spec in specs:
+        source, sep, course_id = spec.rpartition("=")
+        if not sep or not source or not course_id:
+            raise ValueError(f"expected SOURCE=COURSE_ID, got '{spec}'")
+        streams.append((int(source) if source.isdigit() else source, course_id))
+    return streams
+
+
+class StoppableStream:
+    """Stream that reports itself closed once ``stop_event`` is set, ending the pipeline's capture."""
+
+    def __init__(self, stream, stop_event):
+        self.stream = stream
+        self.stop_event = stop_event
+
+    def isOpened(self):
+        return not self.stop_event.is_set() and self.stream.isOpened()
+
+    def read(self):
+        return self.stream.read()
+
+    def release(self):
+        self.stream.release()
+
+
+def run_stream(source, course_id, stats_queue, display, stats_interval, ring_spec=None, stop_event=None):
+    """Worker process body: run the attendance pipeline on one stream.
+
+    ``ring_spec`` is the (name, shape, slots) of the FrameRing filled by the stream's
+    capture process; without it the worker opens the stream itself. Setting
+    ``stop_event`` ends the stream; the pipeline then finishes like at the end of a video
+    and writes the pending attendance.
+    """
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s [{source}] %(message)s')
+    recognizer = attendance_taker.Face_Recognizer(course_id)
+    ring = None
+    if ring_spec:
+        name, shape, slots = ring_spec
+        ring = FrameRing(shape, slots, name=name)
+        cap = RingStream(ring)
+    else:
+        cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        logging.error("Could not open stream %s", source)
+        stats_queue.put({"source": source, "course_id": course_id, "error": "could not open stream"})
+        return
+
+    ring_stream = cap
+    if stop_event is not None:
+        cap = StoppableStream(cap, stop_event)
+
+    def report(stats):
+        if ring is not None:
+            stats["ring_overwritten"] = ring_stream.overwritten
+        stats_queue.put({"source": source, "course_id": course_id, **stats})
+
+    try:
+        recognizer.process(cap, display=display, window_name=f"camera {source} (course {course_id})",
+                           stats_callback=report, stats_interval=stats_interval)
+    finally:
+        cap.release()
+        if ring is not None:
+            ring.release()
+        if display:
+            cv2.destroyAllWindows()
+
+
+def log_stats(stats):
+    if "error" in stats:
+        logging.error("%-20s course %-6s %s", stats["source"], stats["course_id"], stats["error"])
+        return
+    logging.info("%-20s course %-6s %6.1f fps (capture %5.1f) processed %6d dropped %6d lag %6.1f ms (avg %6.1f)",
+                 stats["source"], stats["course_id"], stats["fps"], stats["capture_fps"], stats["processed"],
+                 stats["dropped"], stats["lag_ms"], stats["lag_avg_ms"])
+
+
+def run(streams, display=False, stats_interval=5.0, shared_memory=False, ring_slots=RING_SLOTS):
+    """Start a worker per (source, course_id) and log their stats until all of them finish."""
+    # fork keeps the models loaded by attendance_taker shared copy-on-write with the workers
+    ctx = multiprocessing.get_context("fork")
+    stats_queue = ctx.Queue()
+    stop_event = ctx.Event()
+    workers, rings = [], []
+    for source, course_id in streams:
+        ring_spec = None
+        if shared_memory:
+            shape = probe_frame_shape(source)
+            if shape is None:
+                logging.error("Could not open stream %s", source)
+                continue
+            ring = FrameRing(shape, ring_slots, create=True)
+            rings.append(ring)
+            ring_spec = (ring.name, shape, ring_slots)
+            workers.append(ctx.Process(target=capture_to_ring, name=f"capture-{source}", daemon=True,
+                                       args=(source, ring.name, shape, ring_slots, stop_event)))
+        workers.append(ctx.Process(target=run_stream, name=f"stream-{source}", daemon=True,
+                                   args=(source, course_id, stats_queue, display, stats_interval, ring_spec,
+                                         stop_event)))
+    # The workers inherit SIGINT ignored: Ctrl-C reaches only this process, which stops them
+    # through stop_event instead of interrupting them mid-write
+    previous_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        for worker in workers:
+            worker.start()
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+    latest = {}
+    try:
+        while any(worker.is_alive() for worker in workers) or not stats_queue.empty():
+            try:
+                stats = stats_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            latest[stats["source"]] = stats
+            log_stats(stats)
+    except KeyboardInterrupt:
+        logging.info("Stopping %d worker(s)", len(workers))
+        stop_event.set()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for worker in workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        for worker in workers:
+            if worker.is_alive():
+                logging.warning("%s did not stop within %.0fs, terminating it", worker.name, STOP_TIMEOUT)
+                worker.terminate()
+    for worker in workers:
+        worker.join()
+    # Final stats of workers that stopped after Ctrl-C
+    while True:
+        try:
+            stats = stats_queue.get_nowait()
+        except queue.Empty:
+            break
+        latest[stats["source"]] = stats
+        log_stats(stats)
+    for ring in rings:
+        ring.release(unlink=True)
+    return latest
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    parser = argparse.ArgumentParser(description="Take attendance from several camera streams in parallel")
+    parser.add_argument("streams", nargs="+", metavar="SOURCE=COURSE_ID",
+                        help="camera index or video file, and the course it records")
+    parser.add_argument("--display", action="store_true", help="show a window per stream")
+    parser.add_argument("--stats-interval", type=float, default=5.0, help="seconds between stats reports")
+    parser.add_argument("--shared-memory", action="store_true",
+                        help="capture in a separate process and pass frames through a shared-memory ring")
+    parser.add_argument("--ring-slots", type=int, default=RING_SLOTS, help="frame slots per shared-memory ring")
+    args = parser.parse_args()
+    try:
+        streams = parse_streams(args.streams)
+    except ValueError as e:
+        parser.error(str(e))
+    start = time.monotonic()
+    latest = run(streams, display=args.display, stats_interval=args.stats_interval,
+                 shared_memory=args.shared_memory, ring_slots=args.ring_slots)
+    logging.info("%d stream(s) finished in %.1fs, %d frames processed", len(streams), time.monotonic() - start,
+                 sum(s.get("processed", 0) for s in latest.values()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+# Client for the local recognition service (recognition_server.py) and its wire protocol
+#
+# Every message is a fixed header followed by a payload:
+#   request   magic "FRS1", opcode, top_k, frame count, payload length
+#             payload: per frame a FRAME header (kind, height, width, length) and the image
+#             bytes, either encoded JPEG/PNG or raw BGR pixels
+#   response  magic "FRS1", status, reserved, frame count, payload length
+#             payload of RECOGNIZE: per frame a face count, per face a matched flag and the
+#             candidates (float32 distance, roll and name as length-prefixed UTF-8);
+#             RECOGNIZE_SESSION sends the session id (length-prefixed UTF-8) before its one
+#             frame and gets the descriptors computed/skipped counts before the matches;
+#             STATS and RELOAD answer with JSON, errors with a UTF-8 message
+#
+# The client only needs the standard library and numpy, so web workers that use it never
+# load Dlib or the gallery.
+
+import json
+import os
+import socket
+import struct
+import threading
+
+import numpy as np
+
+MAGIC = b"FRS1"
+HEADER = struct.Struct("!4sBBHI")
+FRAME = struct.Struct("!BHHI")
+FACE = struct.Struct("!BB")
+DISTANCE = struct.Struct("!f")
+COUNT = struct.Struct("!H")
+TRACKING = struct.Struct("!HH")
+
+#  Opcodes
+OP_RECOGNIZE, OP_RELOAD, OP_STATS, OP_RECOGNIZE_SESSION = 1, 2, 3, 4
+
+#  Response status
+STATUS_OK, STATUS_ERROR = 0, 1
+
+#  Frame payload kinds
+FRAME_ENCODED, FRAME_RAW_BGR = 0, 1
+
+#  Largest payload either side accepts (64 MB)
+MAX_PAYLOAD = 64 * 1024 * 1024
+
+#  Socket the service listens on; web workers use the service when RECOGNITION_SOCKET is set
+DEFAULT_SOCKET_PATH = "/tmp/face_recognition.sock"
+RECOGNITION_SOCKET = os.environ.get("RECOGNITION_SOCKET")
+CLIENT_TIMEOUT = float(os.environ.get("RECOGNITION_TIMEOUT", 30))
+
+
+class RecognitionServiceError(Exception):
+    """The service answered with an error, or the connection failed."""
+
+
+def recv_exact(sock, size):
+    """Read exactly ``size`` bytes; returns b"" only if the peer closed before sending any."""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    got = 0
+    while got < size:
+        n = sock.recv_into(view[got:])
+        if n == 0:
+            if got == 0:
+                return b""
+            raise ConnectionError("connection closed mid-message")
+        got += n
+    return bytes(buf)
+
+
+def read_message(sock):
+    """Read one (code, top_k/reserved, count, payload) message, or None on a clean EOF."""
+    header = recv_exact(sock, HEADER.size)
+    if not header:
+        return None
+    magic, code, extra, count, length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError("bad message magic")
+    if length > MAX_PAYLOAD:
+        raise ValueError(f"payload of {length} bytes is too large")
+    return code, extra, count, recv_exact(sock, length) if length else b""
+
+
+def send_message(sock, code, extra, count, parts):
+    payload_len = sum(len(p) for p in parts)
+    sock.sendall(b"".join([HEADER.pack(MAGIC, code, extra, count, payload_len), *parts]))
+
+
+def encode_frame(image):
+    """FRAME header and data for encoded image bytes or a BGR uint8 array."""
+    if isinstance(image, np.ndarray):
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        height, width = image.shape[:2]
+        return [FRAME.pack(FRAME_RAW_BGR, height, width, image.nbytes), memoryview(image).cast("B")]
+    return [FRAME.pack(FRAME_ENCODED, 0, 0, len(image)), image]
+
+
+def iter_frames(payload, count):
+    """Yield (kind, height, width, data) for the frames of a RECOGNIZE request."""
+    offset = 0
+    for _ in range(count):
+        kind, height, width, length = FRAME.unpack_from(payload, offset)
+        offset += FRAME.size
+        yield kind, height, width, payload[offset:offset + length]
+        offset += length
+
+
+def pack_text(text):
+    data = str(text).encode("utf-8")[:255]
+    return struct.pack("!B", len(data)) + data
+
+
+def unpack_text(payload, offset):
+    length = payload[offset]
+    return payload[offset + 1:offset + 1 + length].decode("utf-8", "replace"), offset + 1 + length
+
+
+def encode_matches(matches_per_frame):
+    """Pack RecognitionEngine.match() results, one list per frame."""
+    parts = []
+    for matches in matches_per_frame:
+        parts.append(COUNT.pack(len(matches)))
+        for match in matches:
+            candidates = match["candidates"][:255]
+            parts.append(FACE.pack(1 if match["distance"] is not None else 0, len(candidates)))
+            for c in candidates:
+                parts.append(DISTANCE.pack(c["distance"]) + pack_text(c["roll"]) + pack_text(c["name"]))
+    return parts
+
+
+def decode_matches(payload, count, offset=0):
+    """Inverse of encode_matches(), rebuilding the dicts RecognitionEngine.match() returns."""
+    results = []
+    for _ in range(count):
+        (faces,) = COUNT.unpack_from(payload, offset)
+        offset += COUNT.size
+        matches = []
+        for _ in range(faces):
+            matched, n_candidates = FACE.unpack_from(payload, offset)
+            offset += FACE.size
+            candidates = []
+            for _ in range(n_candidates):
+                (distance,) = DISTANCE.unpack_from(payload, offset)
+                roll, offset = unpack_text(payload, offset + DISTANCE.size)
+                name, offset = unpack_text(payload, offset)
+                candidates.append({"name": name, "roll": roll, "distance": float(distance)})
+            best = dict(candidates[0]) if matched and candidates else {"name": "Unknown", "roll": "-", "distance": None}
+            best["candidates"] = candidates
+            matches.append(best)
+        results.append(matches)
+    return results
+
+
+class RecognitionClient:
+    """Talks to the recognition service, keeping one open connection per thread.
+
+    A request that fails on a reused connection (the service restarted, or closed an idle
+    socket) is retried once on a fresh connection.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=CLIENT_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise RecognitionServiceError(f"cannot connect to recognition service at {self.socket_path}: {e}")
+        return sock
+
+    def close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            self._local.sock = None
+            sock.close()
+
+    def _request(self, opcode, extra=0, count=0, parts=()):
+        for attempt in (0, 1):
+            sock = getattr(self._local, "sock", None)
+            reused = sock is not None
+            if sock is None:
+                sock = self._local.sock = self._connect()
+            try:
+                send_message(sock, opcode, extra, count, parts)
+                message = read_message(sock)
+                if message is None:
+                    raise ConnectionError("service closed the connection")
+                break
+            except (OSError, ValueError) as e:
+                self.close()
+                if not reused or attempt:
+                    raise RecognitionServiceError(f"recognition service request failed: {e}")
+        status, _, count, payload = message
+        if status != STATUS_OK:
+            raise RecognitionServiceError(payload.decode("utf-8", "replace"))
+        return count, payload
+
+    def recognize(self, image, top_k=1):
+        """Recognize the faces in one image (encoded bytes or a BGR array); same result as RecognitionEngine.recognize."""
+        return self.recognize_batch([image], top_k=top_k)[0]
+
+    def recognize_batch(self, images, top_k=1):
+        """Recognize several images in one round trip; one list of matches per image."""
+        parts = [part for image in images for part in encode_frame(image)]
+        count, payload = self._request(OP_RECOGNIZE, min(max(1, top_k), 255), len(images), parts)
+        return decode_matches(payload, count)
+
+    def recognize_session(self, image, session_id, top_k=1):
+        """Same result as RecognitionEngine.recognize_session: (matches, descriptor counts)."""
+        parts = [pack_text(session_id), *encode_frame(image)]
+        count, payload = self._request(OP_RECOGNIZE_SESSION, min(max(1, top_k), 255), 1, parts)
+        computed, skipped = TRACKING.unpack_from(payload)
+        matches = decode_matches(payload, count, offset=TRACKING.size)[0]
+        return matches, {"descriptors_computed": computed, "descriptors_skipped": skipped}
+
+    def reload_gallery(self):
+        """Ask the service to reload the gallery now; returns the number of known faces."""
+        return json.loads(self._request(OP_RELOAD)[1])["gallery_size"]
+
+    def stats(self):
+        """engine_stats() of the service process that answered."""
+        return json.loads(self._request(OP_STATS)[1])
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client(socket_path=None):
+    """Return the process-wide client for RECOGNITION_SOCKET (or ``socket_path``)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = RecognitionClient(socket_path or RECOGNITION_SOCKET or DEFAULT_SOCKET_PATH)
+    return _client
@@ -0,0 +1,243 @@
+# Long-lived face recognition engine shared by every request in a worker process
+
+import logging
+import os
+import threading
+import time
+
+import dlib
+import numpy as np
+
+from ann_index import INDEX_PATH, load_index_for
+from face_detection import DEFAULT_DETECTION_MODE, DetectionStats, create_detector, timed_detect
+from face_gallery import FEATURE_DIM, FEATURES_CSV_PATH, GALLERY_PATH, load_gallery, memory_usage
+from face_tracking import SessionStore
+
+#  Paths of the Dlib models and of the known-face gallery
+PREDICTOR_PATH = "data/data_dlib/shape_predictor_68_face_landmarks.dat"
+FACE_RECO_MODEL_PATH = "data/data_dlib/dlib_face_recognition_resnet_model_v1.dat"
+
+#  Faces closer than this e-distance to a known face are treated as a match
+MATCH_THRESHOLD = 0.4
+
+#  Seconds between checks of the gallery files for a newer generation
+GALLERY_CHECK_INTERVAL = float(os.environ.get("GALLERY_CHECK_INTERVAL", 1.0))
+
+
+class GalleryWatcher:
+    """Keeps a loaded gallery and swaps in a new one when the files on disk change.
+
+    Changes are detected from the stat of the manifest, the legacy CSV and the ANN index
+    metadata, checked at most every ``interval`` seconds, so a request costs a few stat
+    calls at most and never a full reload unless something changed. Callers take one
+    snapshot per request from current() and keep using it even if a reload happens.
+    """
+
+    def __init__(self, gallery_path=GALLERY_PATH, interval=GALLERY_CHECK_INTERVAL):
+        self.gallery_path = gallery_path
+        self.interval = interval
+        self.gallery = None
+        self._stamp = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self.reload()
+
+    def _file_stamp(self):
+        stamp = []
+        for path in (self.gallery_path, FEATURES_CSV_PATH, os.path.join(INDEX_PATH, "meta.json")):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def _load(self):
+        stamp = self._file_stamp()
+        gallery = load_gallery(self.gallery_path)
+        gallery.index = load_index_for(gallery)
+        # Rebinding one attribute swaps the gallery atomically for concurrent readers
+        self.gallery, self._stamp = gallery, stamp
+        logging.info("Faces in Database: %d (generation %s)", len(gallery), gallery.generation)
+
+    def reload(self):
+        """Load the gallery from disk now."""
+        with self._reload_lock:
+            self._load()
+        return self.gallery
+
+    def current(self):
+        """Return the current gallery, reloading first if the files changed."""
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.interval
+            # Only one thread reloads; the others carry on with the gallery they have
+            if self._file_stamp() != self._stamp and self._reload_lock.acquire(blocking=False):
+                try:
+                    self._load()
+                except (OSError, ValueError) as e:
+                    logging.warning("Gallery reload failed, keeping generation %s: %s",
+                                    self.gallery.generation, e)
+                finally:
+                    self._reload_lock.release()
+        return self.gallery
+
+
+class RecognitionEngine:
+    """Owns the Dlib models and the known-face gallery so they are loaded once per process."""
+
+    def __init__(self, gallery_path=GALLERY_PATH, predictor_path=PREDICTOR_PATH,
+                 face_reco_model_path=FACE_RECO_MODEL_PATH, detector_backend=None,
+                 detection_mode=DEFAULT_DETECTION_MODE):
+        #  Configured face detector backend, Dlib landmark predictor and resnet descriptor model
+        self.detector = create_detector(detector_backend, mode=detection_mode)
+        self.predictor = dlib.shape_predictor(predictor_path)
+        self.face_reco_model = dlib.face_recognition_model_v1(face_reco_model_path)
+        self.detection_stats = DetectionStats()
+        #  Face tracks of the camera sessions served by this process
+        self.sessions = SessionStore()
+
+        # The resnet model keeps per-call state, so descriptor computation is serialised
+        self._model_lock = threading.Lock()
+        self.gallery_watcher = GalleryWatcher(gallery_path)
+
+    @property
+    def gallery(self):
+        return self.gallery_watcher.current()
+
+    def load_gallery(self):
+        """Reload the known faces now instead of waiting for the next change check."""
+        return len(self.gallery_watcher.reload())
+
+    def detect(self, img_bgr):
+        """Find faces with the configured detector, in full-resolution coordinates."""
+        return timed_detect(self.detector, img_bgr, self.detection_stats)
+
+    def compute_descriptors(self, img_bgr, faces):
+        """Return a (len(faces), 128) float32 matrix of descriptors for the detected faces."""
+        descriptors = np.empty((len(faces), FEATURE_DIM), dtype=np.float32)
+        with self._model_lock:
+            for i, face in enumerate(faces):
+                shape = self.predictor(img_bgr, face)
+                descriptors[i] = self.face_reco_model.compute_face_descriptor(img_bgr, shape)
+        return descriptors
+
+    def match(self, descriptors, top_k=1, gallery=None):
+        """Match descriptors against the gallery in one batched search.
+
+        Returns one dict per descriptor with the best ``name``, ``roll`` and ``distance``
+        (``Unknown``/``-``/None when nothing is under the threshold) and the ``candidates``
+        list of the ``top_k`` nearest known faces.
+        """
+        gallery = gallery if gallery is not None else self.gallery
+        distances, indices = gallery.search(descriptors, k=max(1, top_k))
+        results = []
+        for row_dist, row_idx in zip(distances, indices):
+            candidates = [{'name': gallery.names[i], 'roll': gallery.rolls[i], 'distance': float(d)}
+                          for d, i in zip(row_dist, row_idx) if np.isfinite(d)]
+            if candidates and candidates[0]['distance'] < MATCH_THRESHOLD:
+                best = dict(candidates[0])
+            else:
+                best = {'name': 'Unknown', 'roll': '-', 'distance': None}
+            best['candidates'] = candidates
+            results.append(best)
+        return results
+
+    def recognize(self, img_bgr, top_k=1):
+        """Detect every face in a BGR image and match all of them against the gallery at once."""
+        gallery = self.gallery
+        faces = self.detect(img_bgr)
+        if len(faces) == 0:
+            return []
+        return self.match(self.compute_descriptors(img_bgr, faces), top_k=top_k, gallery=gallery)
+
+    def recognize_session(self, img_bgr, session_id, top_k=1):
+        """recognize() for a snapshot of a camera session, reusing identities of tracked faces.
+
+        Faces that continue a confirmed track of the session keep its match and skip the
+        landmark and descriptor step. Returns ``(matches, counts)`` where counts holds this
+        frame's ``descriptors_computed`` and ``descriptors_skipped``.
+        """
+        gallery = self.gallery
+        faces = self.detect(img_bgr)
+        tracker = self.sessions.get(session_id)
+        with tracker.lock:
+            tracks = tracker.update(faces)
+            todo = [i for i, track in enumerate(tracks) if tracker.needs_descriptor(track, top_k)]
+            if todo:
+                descriptors = self.compute_descriptors(img_bgr, [faces[i] for i in todo])
+                for i, match in zip(todo, self.match(descriptors, top_k=top_k, gallery=gallery)):
+                    tracker.set_match(tracks[i], match, top_k)
+            tracker.record(len(todo), len(faces) - len(todo))
+            matches = [dict(track.match) for track in tracks]
+        return matches, {'descriptors_computed': len(todo), 'descriptors_skipped': len(faces) - len(todo)}
+
+    def recognize_batch(self, images_bgr, top_k=1):
+        """Recognize the faces in several frames with one batched descriptor call.
+
+        Detection and landmarking run per frame; the resnet model then gets every face of
+        every frame in a single compute_face_descriptor call and all descriptors are matched
+        in one gallery search. Returns one list of matches per input frame.
+        """
+        gallery = self.gallery
+        batch_images, batch_faces, frame_of_batch = [], [], []
+        for frame_idx, img_bgr in enumerate(images_bgr):
+            faces = self.detect(img_bgr)
+            if len(faces) == 0:
+                continue
+            batch_images.append(img_bgr)
+            batch_faces.append(faces)
+            frame_of_batch.append(frame_idx)
+
+        results = [[] for _ in images_bgr]
+        if not batch_images:
+            return results
+        # The shape predictor is guarded by the same lock as the resnet model, as in compute_descriptors()
+        with self._model_lock:
+            batch_shapes = []
+            for img_bgr, faces in zip(batch_images, batch_faces):
+                shapes = dlib.full_object_detections()
+                for face in faces:
+                    shapes.append(self.predictor(img_bgr, face))
+                batch_shapes.append(shapes)
+            batch_descriptors = self.face_reco_model.compute_face_descriptor(batch_images, batch_shapes)
+        counts = [len(d) for d in batch_descriptors]
+        descriptors = np.array([list(d) for frame in batch_descriptors for d in frame], dtype=np.float32)
+        matches = self.match(descriptors, top_k=top_k, gallery=gallery)
+        start = 0
+        for frame_idx, count in zip(frame_of_batch, counts):
+            results[frame_idx] = matches[start:start + count]
+            start += count
+        return results
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the process-wide engine, creating it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RecognitionEngine()
+    return _engine
+
+
+def reload_gallery():
+    """Reload the gallery of an already created engine (no-op before first use)."""
+    if _engine is not None:
+        _engine.load_gallery()
+
+
+def engine_stats():
+    """Process id, memory use and gallery state of this worker, without creating the engine."""
+    stats = {"pid": os.getpid(), "engine_loaded": _engine is not None, "memory": memory_usage()}
+    if _engine is not None:
+        gallery = _engine.gallery_watcher.gallery
+        stats.update({"gallery_size": len(gallery), "gallery_generation": gallery.generation,
+                      "ann_index": gallery.index is not None, "detector": _engine.detector.label,
+                      "detection": _engine.detection_stats.summary(),
+                      "tracking": _engine.sessions.summary()})
+    return stats
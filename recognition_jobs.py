@@ -0,0 +1,180 @@
+# Asynchronous recognition jobs run on a local process pool, or on the recognition service
+#
+# The web request only queues the encoded image and returns a job id; the CPU-heavy Dlib
+# work happens in pool processes so gunicorn threads stay free for the dashboard pages.
+# With RECOGNITION_SOCKET set a thread pool forwards the encoded images to the service
+# instead, and neither the web worker nor a pool process loads the models.
+# Job state lives in SQLite so any gunicorn worker can answer the result poll, and the
+# queue bound counts the jobs of every worker on the host.
+
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from db import get_connection, retry_on_busy
+from migrations import migrate
+from recognition_client import RECOGNITION_SOCKET, get_client
+
+#  Recognition processes for the whole host (one per core minus one by default), split
+#  evenly between the gunicorn workers, each of which owns a pool. gunicorn.conf.py takes
+#  its worker count from WEB_WORKERS so both use the same default.
+HOST_RECOGNITION_WORKERS = int(os.environ.get("RECOGNITION_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+WEB_WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY", 2)))
+RECOGNITION_WORKERS = max(1, HOST_RECOGNITION_WORKERS // WEB_WORKERS)
+
+#  Jobs waiting on the host before submits are refused, how long finished results are
+#  kept, and after how long a job that never finished (its worker died) is dropped
+MAX_PENDING_JOBS = int(os.environ.get("MAX_PENDING_JOBS", 4 * HOST_RECOGNITION_WORKERS))
+JOB_RESULT_TTL = 600
+JOB_STALE_AFTER = float(os.environ.get("JOB_STALE_AFTER", 120))
+
+
+class QueueFull(Exception):
+    """Raised when MAX_PENDING_JOBS jobs are already waiting on the host."""
+
+
+def _init_worker():
+    # Lower priority so web requests win the CPU when recognition saturates the cores
+    try:
+        os.nice(5)
+    except (AttributeError, OSError):
+        pass
+    from recognition_engine import get_engine
+    get_engine()
+
+
+def _run_job(image_bytes, top_k):
+    """Pool entry point: decode the image and recognize its faces."""
+    from recognition_engine import get_engine
+    img_bgr = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img_bgr is None:
+        raise ValueError("Could not decode image.")
+    return get_engine().recognize(img_bgr, top_k=top_k)
+
+
+def _run_job_on_service(image_bytes, top_k):
+    """Thread pool entry point with RECOGNITION_SOCKET: the service decodes and recognizes."""
+    return get_client().recognize(image_bytes, top_k=top_k)
+
+
+class JobQueue:
+    """Host-wide bounded queue of recognition jobs in front of this process's pool.
+
+    ``on_result(matches, course_id, top_k)`` runs in this process when a job finishes (used
+    to mark attendance) and its return value is stored as the job result.
+    """
+
+    def __init__(self, db_path, on_result, max_workers=RECOGNITION_WORKERS, max_pending=MAX_PENDING_JOBS):
+        self.db_path = db_path
+        self.on_result = on_result
+        self.max_pending = max_pending
+        if RECOGNITION_SOCKET:
+            # The threads only wait on the service socket (one connection each)
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recognition-job")
+            self._run_job = _run_job_on_service
+        else:
+            # forkserver, not fork: a forked child of this threaded worker would inherit the
+            # preloaded engine's locks in whatever state a request thread left them
+            self._executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                                 mp_context=multiprocessing.get_context("forkserver"))
+            self._run_job = _run_job
+        self._pending = 0
+        self._lock = threading.Lock()
+        # The recognition_jobs table comes from migration 4
+        migrate(db_path)
+
+    @retry_on_busy
+    def _execute(self, *statements):
+        """Run (sql, params) statements in one transaction and return the rows of the last one."""
+        conn = get_connection(self.db_path)
+        try:
+            with conn:
+                for statement in statements:
+                    sql, params = statement if isinstance(statement, tuple) else (statement, ())
+                    rows = conn.execute(sql, params).fetchall()
+            return rows
+        finally:
+            conn.close()
+
+    def submit(self, image_bytes, course_id, top_k=1):
+        """Queue a job and return its id, or raise QueueFull."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        # The bound is checked against the queued rows of all workers in the same statement
+        # that inserts the job, so concurrent submits cannot overshoot it
+        inserted = self._execute(
+            ("DELETE FROM recognition_jobs WHERE finished_at < ? OR (finished_at IS NULL AND created_at < ?)",
+             (now - JOB_RESULT_TTL, now - JOB_STALE_AFTER)),
+            ("""INSERT INTO recognition_jobs (id, course_id, status, created_at)
+                SELECT ?, ?, 'queued', ?
+                WHERE (SELECT COUNT(*) FROM recognition_jobs WHERE status = 'queued') < ?
+                RETURNING id""", (job_id, str(course_id), now, self.max_pending)))
+        if not inserted:
+            raise QueueFull(f"{self.max_pending} recognition jobs already pending")
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(self._run_job, image_bytes, top_k)
+        except Exception as e:
+            with self._lock:
+                self._pending -= 1
+            self._execute(("UPDATE recognition_jobs SET status = 'error', error = ?, finished_at = ? WHERE id = ?",
+                           (str(e), time.time(), job_id)))
+            raise
+        future.add_done_callback(lambda f: self._finish(job_id, course_id, top_k, f))
+        return job_id
+
+    def _finish(self, job_id, course_id, top_k, future):
+        try:
+            try:
+                result, error = json.dumps(self.on_result(future.result(), course_id, top_k)), None
+            except Exception as e:
+                result, error = None, str(e)
+                logging.warning("Recognition job %s failed: %s", job_id, e)
+            self._execute(("UPDATE recognition_jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                           ('error' if error else 'done', result, error, time.time(), job_id)))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def get(self, job_id, wait=0.0, poll_interval=0.1):
+        """Return the job row as a dict (None if unknown), long-polling up to ``wait`` seconds."""
+        deadline = time.monotonic() + wait
+        while True:
+            rows = self._execute(("SELECT * FROM recognition_jobs WHERE id = ?", (job_id,)))
+            row = rows[0] if rows else None
+            if row is None or row['status'] != 'queued' or time.monotonic() >= deadline:
+                break
+            time.sleep(poll_interval)
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    @property
+    def pending(self):
+        """Jobs of this process still running on its pool."""
+        return self._pending
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue(db_path, on_result):
+    """Return this process's job queue, creating the pool on first use (after gunicorn forks)."""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue(db_path, on_result)
+    return _job_queue
@@ -0,0 +1,143 @@
+# Standalone face recognition service on a Unix domain socket
+#
+# Owns the Dlib models and the known-face gallery so the web workers only forward image
+# bytes (see recognition_client.py for the protocol). The models are loaded once before
+# the listening socket is shared with the forked worker processes.
+#
+#   python recognition_server.py [--socket PATH] [--workers N]
+
+import argparse
+import json
+import logging
+import os
+import signal
+import socketserver
+
+import cv2
+import numpy as np
+
+from recognition_client import (DEFAULT_SOCKET_PATH, FRAME_RAW_BGR, OP_RECOGNIZE, OP_RECOGNIZE_SESSION,
+                                OP_RELOAD, OP_STATS, RECOGNITION_SOCKET, STATUS_ERROR, STATUS_OK, TRACKING,
+                                encode_matches, iter_frames, read_message, send_message, unpack_text)
+from recognition_engine import engine_stats, get_engine
+
+#  Service processes sharing the socket, each with its own models and memory-mapped gallery
+SERVER_WORKERS = int(os.environ.get("RECOGNITION_SERVER_WORKERS", 1))
+
+
+def decode_frame(kind, height, width, data):
+    """BGR image of a request frame, or None if it cannot be decoded."""
+    if kind == FRAME_RAW_BGR:
+        if len(data) != height * width * 3:
+            return None
+        return np.frombuffer(data, np.uint8).reshape(height, width, 3)
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+class RecognitionHandler(socketserver.BaseRequestHandler):
+    """Serves requests on one client connection until the client closes it."""
+
+    def handle(self):
+        while True:
+            try:
+                message = read_message(self.request)
+            except (OSError, ValueError) as e:
+                logging.warning("Dropping client connection: %s", e)
+                return
+            if message is None:
+                return
+            opcode, top_k, count, payload = message
+            try:
+                status, count, parts = STATUS_OK, *self.dispatch(opcode, top_k, count, payload)
+            except Exception as e:
+                logging.exception("Recognition request failed")
+                status, count, parts = STATUS_ERROR, 0, [str(e).encode("utf-8")]
+            try:
+                send_message(self.request, status, 0, count, parts)
+            except OSError:
+                return
+
+    def dispatch(self, opcode, top_k, count, payload):
+        engine = get_engine()
+        if opcode == OP_RECOGNIZE_SESSION:
+            session_id, offset = unpack_text(payload, 0)
+            img_bgr = self.decode_frames(payload[offset:], 1)[0]
+            matches, counts = engine.recognize_session(img_bgr, session_id, top_k=top_k)
+            return 1, [TRACKING.pack(counts['descriptors_computed'], counts['descriptors_skipped']),
+                       *encode_matches([matches])]
+        if opcode == OP_RECOGNIZE:
+            images = self.decode_frames(payload, count)
+            if len(images) == 1:
+                return 1, encode_matches([engine.recognize(images[0], top_k=top_k)])
+            return len(images), encode_matches(engine.recognize_batch(images, top_k=top_k))
+        if opcode == OP_RELOAD:
+            return 0, [json.dumps({"gallery_size": engine.load_gallery()}).encode("utf-8")]
+        if opcode == OP_STATS:
+            return 0, [json.dumps(engine_stats()).encode("utf-8")]
+        raise ValueError(f"unknown opcode {opcode}")
+
+    @staticmethod
+    def decode_frames(payload, count):
+        images = []
+        for i, frame in enumerate(iter_frames(payload, count)):
+            img_bgr = decode_frame(*frame)
+            if img_bgr is None:
+                raise ValueError(f"Could not decode image {i}.")
+            images.append(img_bgr)
+        return images
+
+
+class RecognitionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path=DEFAULT_SOCKET_PATH, workers=SERVER_WORKERS):
+    """Load the engine, bind the socket and serve it from ``workers`` processes."""
+    get_engine()
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = RecognitionServer(socket_path, RecognitionHandler)
+    os.chmod(socket_path, 0o660)
+    logging.info("Recognition service listening on %s with %d process(es)", socket_path, workers)
+
+    # Forked children accept on the same listening socket and share the loaded pages
+    children, is_parent = [], True
+    for _ in range(workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            children, is_parent = [], False
+            break
+        children.append(pid)
+
+    def shutdown(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        if is_parent:
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                    os.waitpid(pid, 0)
+                except OSError:
+                    pass
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(message)s')
+    parser = argparse.ArgumentParser(description="Serve face recognition on a Unix domain socket")
+    parser.add_argument("--socket", default=RECOGNITION_SOCKET or DEFAULT_SOCKET_PATH)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    args = parser.parse_args()
+    serve(args.socket, max(1, args.workers))
+
+
+if __name__ == '__main__':
+    main()
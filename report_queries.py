@@ -0,0 +1,114 @@
+# SQL of the attendance reports and lookups
+#
+# app.py runs these queries and migrations.py --check-plans explains the very same text,
+# so the plan checks follow any change made to a report query. Date-filtered totals read
+# the per-day rollup, unfiltered ones the much smaller per-month rollup (migration 3).
+
+ATTENDANCE_SUMMARY_QUERY = "SELECT SUM(present), SUM(total) FROM attendance_monthly"
+
+ATTENDANCE_DATA_QUERY = """
+    SELECT s.roll_number, s.name, c.name as course_name, a.present
+    FROM attendance a
+    JOIN students s ON a.student_id = s.id
+    JOIN courses c ON a.course_id = c.id
+    WHERE a.date = ? AND a.course_id = ?
+    ORDER BY s.roll_number
+"""
+
+COURSES_IN_SEMESTER_QUERY = """
+    SELECT DISTINCT c.id, c.name
+    FROM attendance a
+    JOIN courses c ON a.course_id = c.id
+    WHERE a.date BETWEEN ? AND ?
+    ORDER BY c.name
+"""
+
+CLASSES_HELD_QUERY = """
+    SELECT COUNT(DISTINCT date)
+    FROM attendance
+    WHERE course_id = ? AND date BETWEEN ? AND ?
+"""
+
+#  Classes of a student in a course and period that were attended (1) or missed (0)
+CLASSES_WITH_PRESENCE_QUERY = """
+    SELECT COUNT(*)
+    FROM attendance
+    WHERE student_id = ? AND course_id = ? AND present = ? AND date BETWEEN ? AND ?
+"""
+
+
+def build_date_filter_sql(start_date, end_date):
+    """Builds the WHERE clause and parameters for date filtering."""
+    date_filter_sql = ""
+    query_params = []
+    if start_date and end_date:
+        date_filter_sql = " WHERE a.date BETWEEN ? AND ? "
+        query_params = [start_date, end_date]
+    return date_filter_sql, query_params
+
+
+def _rollup(date_filter_sql):
+    # Per-day rollup for a date range, the smaller per-month one for all time
+    return "attendance_daily" if date_filter_sql else "attendance_monthly"
+
+
+def overall_attendance_sql(date_filter_sql):
+    return f"SELECT SUM(present), SUM(total) FROM {_rollup(date_filter_sql)} a {date_filter_sql.strip()}"
+
+
+def course_stats_sql(date_filter_sql):
+    return f"""
+        SELECT
+            c.id, c.name, SUM(a.present) AS total_present, SUM(a.total) AS total_records
+        FROM {_rollup(date_filter_sql)} a
+        JOIN courses c ON a.course_id = c.id
+        {date_filter_sql.strip()}
+        GROUP BY c.id, c.name
+        ORDER BY c.name
+    """
+
+
+def attendance_trend_sql(date_filter_sql):
+    if date_filter_sql:
+        return f"""
+            SELECT substr(date, 1, 7) AS month, SUM(present) AS monthly_present, SUM(total) AS monthly_total
+            FROM attendance_daily a
+            {date_filter_sql.strip()}
+            GROUP BY month ORDER BY month
+        """
+    return """
+        SELECT month, SUM(present) AS monthly_present, SUM(total) AS monthly_total
+        FROM attendance_monthly
+        GROUP BY month ORDER BY month
+    """
+
+
+def low_attendance_query(start_date, end_date, course_id):
+    """(sql, params) of the per-student totals, filtered by period and/or course when given."""
+    where_clauses = []
+    query_params = []
+
+    if start_date and end_date:
+        where_clauses.append("a.date BETWEEN ? AND ?")
+        query_params.extend([start_date, end_date])
+
+    if course_id is not None:
+        where_clauses.append("a.course_id = ?")
+        query_params.append(course_id)
+
+    where_sql = ""
+    if where_clauses:
+        where_sql = " WHERE " + " AND ".join(where_clauses)
+
+    low_attendance_sql = f"""
+        SELECT
+            s.id, s.roll_number, s.name,
+            SUM(CASE WHEN a.present = 1 THEN 1 ELSE 0 END) AS student_present_period,
+            COUNT(a.id) AS student_total_period
+        FROM students s
+        JOIN attendance a ON s.id = a.student_id
+        {where_sql}
+        GROUP BY s.id, s.roll_number, s.name
+        HAVING COUNT(a.id) > 0
+    """
+    return low_attendance_sql, query_params
@@ -1,5 +1,14 @@
 // attendance_camera.js - Camera UI and AJAX for attendance
 let videoStream = null;
+// Live recognition sends frames back to back under one session id, so the server can follow
+// the faces between them and skip re-embedding students it already recognized. Manual
+// snapshots are seconds apart and are always recognized from scratch.
+let liveRunning = false;
+const LIVE_MIN_INTERVAL_MS = 100;
+
+function newSessionId() {
+    return (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : String(Date.now()) + Math.random();
+}
 
 function showStatus(msg, type = 'info') {
     const statusDiv = document.getElementById('attendance-status');
@@ -21,6 +30,7 @@ async function startCamera() {
 }
 
 function stopCamera() {
+    stopLive();
     if (videoStream) {
         videoStream.getTracks().forEach(track => track.stop());
     }
@@ -33,23 +43,24 @@ function captureImage() {
     canvas.height = video.videoHeight;
     const ctx = canvas.getContext('2d');
     ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
-    return canvas.toDataURL('image/jpeg');
+    // Binary JPEG blob: ~33% smaller than a base64 data URL and decoded directly by the server
+    return new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg'));
 }
 
-async function sendImageForRecognition(courseId) {
-    showStatus('Recognizing face...', 'info');
-    const imageData = captureImage();
+async function sendImageForRecognition(courseId, sessionId = null) {
+    if (!sessionId) showStatus('Recognizing face...', 'info');
+    const imageBlob = await captureImage();
+    const formData = new FormData();
+    formData.append('image', imageBlob, 'frame.jpg');
+    formData.append('course_id', courseId);
+    if (sessionId) formData.append('session_id', sessionId);
     try {
         const res = await fetch('/api/recognize_face', {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json',
                 'X-CSRFToken': document.querySelector('input[name="csrf_token"]').value
             },
-            body: JSON.stringify({
-                image: imageData,
-                course_id: courseId
-            })
+            body: formData
         });
         const result = await res.json();
         if (result.status === 'success') {
@@ -63,7 +74,11 @@ async function sendImageForRecognition(courseId) {
             } else {
                 recognizedNameDiv.textContent = result.name + (result.roll !== '-' ? ` (Roll: ${result.roll})` : '');
             }
-            showStatus('Recognized faces', 'success');
+            if (sessionId && result.tracking) {
+                showStatus(`Live: ${result.recognized.length} face(s), ${result.tracking.descriptors_skipped} reused from tracking`, 'success');
+            } else {
+                showStatus('Recognized faces', 'success');
+            }
         } else {
             showStatus(result.message || 'Recognition failed.', 'warning');
             document.getElementById('recognized-name').textContent = 'Unknown';
@@ -74,10 +89,32 @@ async function sendImageForRecognition(courseId) {
     }
 }
 
+// One request in flight at a time; the next frame is sent as soon as the answer arrives
+async function runLive(courseId) {
+    const sessionId = newSessionId();
+    const liveBtn = document.getElementById('live-btn');
+    liveRunning = true;
+    if (liveBtn) liveBtn.innerHTML = '<i class="fas fa-pause"></i> Stop Live';
+    while (liveRunning && videoStream) {
+        const started = performance.now();
+        await sendImageForRecognition(courseId, sessionId);
+        const wait = LIVE_MIN_INTERVAL_MS - (performance.now() - started);
+        if (wait > 0) await new Promise(resolve => setTimeout(resolve, wait));
+    }
+    stopLive();
+}
+
+function stopLive() {
+    liveRunning = false;
+    const liveBtn = document.getElementById('live-btn');
+    if (liveBtn) liveBtn.innerHTML = '<i class="fas fa-play"></i> Live Recognition';
+}
+
 document.addEventListener('DOMContentLoaded', function() {
     const startBtn = document.getElementById('start-camera-btn');
     const snapBtn = document.getElementById('snap-btn');
     const stopBtn = document.getElementById('stop-camera-btn');
+    const liveBtn = document.getElementById('live-btn');
     const courseSelect = document.getElementById('attendance-course-id');
 
     if (startBtn) startBtn.onclick = startCamera;
@@ -85,4 +122,13 @@ document.addEventListener('DOMContentLoaded', function() {
     if (snapBtn) snapBtn.onclick = function() {
         sendImageForRecognition(courseSelect.value);
     };
+    if (liveBtn) liveBtn.onclick = function() {
+        if (liveRunning) {
+            stopLive();
+        } else if (!videoStream) {
+            showStatus('Start the camera first', 'warning');
+        } else {
+            runLive(courseSelect.value);
+        }
+    };
 });
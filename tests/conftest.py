@@ -0,0 +1,46 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#  attendance.db as it was before migrations.py, without the teachers table the tests do not need
+BASE_SCHEMA = """
+    CREATE TABLE students (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        roll_number TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL
+    );
+    CREATE TABLE courses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        type TEXT NOT NULL
+    );
+    CREATE TABLE attendance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        course_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        present INTEGER NOT NULL,
+        FOREIGN KEY(student_id) REFERENCES students(id),
+        FOREIGN KEY(course_id) REFERENCES courses(id)
+    );
+"""
+
+STUDENTS = [(f"20031{i:02d}", f"Student {i}") for i in range(1, 11)]
+COURSES = [("CSE 1101", "theory"), ("CSE 1102", "lab")]
+
+
+@pytest.fixture
+def base_db(tmp_path):
+    """Path of an unmigrated attendance database with 10 students and 2 courses, no attendance."""
+    path = str(tmp_path / "attendance.db")
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executescript(BASE_SCHEMA)
+        conn.executemany("INSERT INTO students (roll_number, name) VALUES (?, ?)", STUDENTS)
+        conn.executemany("INSERT INTO courses (name, type) VALUES (?, ?)", COURSES)
+    conn.close()
+    return path
@@ -0,0 +1,110 @@
+import sqlite3
+import time
+
+import pytest
+
+import attendance_buffer
+from attendance_buffer import AttendanceBuffer
+
+DATE = "2025-03-10"
+
+
+@pytest.fixture
+def buffer(base_db):
+    # A long interval and a large batch: only explicit flushes write
+    buf = AttendanceBuffer(base_db, flush_interval=3600, flush_size=1000)
+    yield buf
+    buf.close()
+
+
+def present_rolls(db_path, course_id=1, date=DATE):
+    conn = sqlite3.connect(db_path)
+    try:
+        return sorted(r[0] for r in conn.execute(
+            "SELECT s.roll_number FROM attendance a JOIN students s ON s.id = a.student_id "
+            "WHERE a.course_id = ? AND a.date = ? AND a.present = 1", (course_id, date)))
+    finally:
+        conn.close()
+
+
+def test_repeat_marks_are_skipped_in_memory(buffer, base_db):
+    assert buffer.mark("2003101", 1, DATE)
+    assert not buffer.mark("2003101", 1, DATE)
+    assert not buffer.mark(2003101, "1", DATE)
+    # Same student in another course or on another day is a new mark
+    assert buffer.mark("2003101", 2, DATE)
+    assert buffer.mark("2003101", 1, "2025-03-11")
+    assert buffer.stats() == {"marks": 5, "skipped": 2, "writes": 0, "flushes": 0, "pending": 3}
+    assert present_rolls(base_db) == []
+
+
+def test_flush_writes_pending_marks_in_one_batch(buffer, base_db):
+    for roll in ("2003101", "2003102", "2003101"):
+        buffer.mark(roll, 1, DATE)
+    assert buffer.flush() == 2
+    assert present_rolls(base_db) == ["2003101", "2003102"]
+    assert buffer.flush() == 0
+    assert buffer.stats()["flushes"] == 1
+
+
+def test_flush_updates_absent_rows_instead_of_duplicating_them(buffer, base_db):
+    conn = sqlite3.connect(base_db)
+    with conn:
+        conn.execute("INSERT INTO attendance (student_id, course_id, date, present) VALUES (1, 1, ?, 0)", (DATE,))
+    buffer.mark("2003101", 1, DATE)
+    buffer.flush()
+    rows = conn.execute("SELECT present FROM attendance WHERE student_id = 1 AND course_id = 1 AND date = ?",
+                        (DATE,)).fetchall()
+    conn.close()
+    assert rows == [(1,)]
+
+
+def test_unknown_rolls_are_not_written(buffer, base_db):
+    buffer.mark("9999999", 1, DATE)
+    buffer.mark("2003103", 1, DATE)
+    assert buffer.flush() == 1
+    assert present_rolls(base_db) == ["2003103"]
+
+
+def test_failed_flush_keeps_the_marks(buffer, base_db, monkeypatch):
+    buffer.mark("2003104", 1, DATE)
+
+    def failing(pending):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(buffer, "_write", failing)
+    assert buffer.flush() == 0
+    assert buffer.stats()["pending"] == 1
+    monkeypatch.undo()
+    assert buffer.flush() == 1
+    assert present_rolls(base_db) == ["2003104"]
+
+
+def test_full_batch_is_flushed_by_the_background_thread(base_db):
+    buf = AttendanceBuffer(base_db, flush_interval=3600, flush_size=2)
+    try:
+        buf.mark("2003105", 1, DATE)
+        buf.mark("2003106", 1, DATE)
+        deadline = time.monotonic() + 5
+        while not buf.stats()["flushes"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert present_rolls(base_db) == ["2003105", "2003106"]
+    finally:
+        buf.close()
+
+
+def test_close_flushes_what_is_pending(base_db):
+    buf = AttendanceBuffer(base_db, flush_interval=3600, flush_size=1000)
+    buf.mark("2003107", 1, DATE)
+    buf.close()
+    assert present_rolls(base_db) == ["2003107"]
+
+
+def test_oldest_sessions_are_forgotten(buffer, monkeypatch):
+    monkeypatch.setattr(attendance_buffer, "MAX_MARKED_SESSIONS", 2)
+    buffer.mark("2003101", 1, DATE)
+    buffer.mark("2003101", 2, DATE)
+    buffer.mark("2003101", 1, DATE)            # refreshes (1, DATE)
+    buffer.mark("2003101", 3, DATE)            # evicts (2, DATE)
+    assert not buffer.mark("2003101", 1, DATE)
+    assert buffer.mark("2003101", 2, DATE)
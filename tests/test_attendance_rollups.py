@@ -0,0 +1,95 @@
+import random
+import sqlite3
+
+import pytest
+
+from attendance_buffer import MARK_PRESENT
+from migrations import migrate, rebuild_rollups
+
+DATES = [f"2025-{month:02d}-{day:02d}" for month in (1, 2, 3) for day in (1, 15, 28)]
+
+
+@pytest.fixture
+def conn(base_db):
+    migrate(base_db)
+    conn = sqlite3.connect(base_db)
+    yield conn
+    conn.close()
+
+
+def rollups(conn):
+    daily = conn.execute("SELECT date, course_id, present, total FROM attendance_daily ORDER BY 1, 2").fetchall()
+    monthly = conn.execute("SELECT month, course_id, present, total FROM attendance_monthly ORDER BY 1, 2").fetchall()
+    return daily, monthly
+
+
+def grouped(conn):
+    daily = conn.execute("""
+        SELECT date, course_id, SUM(present), COUNT(*) FROM attendance GROUP BY 1, 2 ORDER BY 1, 2
+    """).fetchall()
+    monthly = conn.execute("""
+        SELECT substr(date, 1, 7), course_id, SUM(present), COUNT(*) FROM attendance GROUP BY 1, 2 ORDER BY 1, 2
+    """).fetchall()
+    return daily, monthly
+
+
+def random_write(conn, rng):
+    student, course, date = rng.randint(1, 10), rng.randint(1, 2), rng.choice(DATES)
+    action = rng.randrange(6)
+    if action == 0:
+        conn.execute("INSERT OR IGNORE INTO attendance (student_id, course_id, date, present) VALUES (?, ?, ?, ?)",
+                     (student, course, date, rng.randint(0, 1)))
+    elif action == 1:
+        conn.execute(MARK_PRESENT, (course, date, f"20031{student:02d}"))
+    elif action == 2:
+        conn.execute("UPDATE attendance SET present = ? WHERE student_id = ? AND course_id = ? AND date = ?",
+                     (rng.randint(0, 1), student, course, date))
+    elif action == 3:
+        # Moves a row to another day, unless that would duplicate one
+        conn.execute("UPDATE OR IGNORE attendance SET date = ? WHERE student_id = ? AND course_id = ?",
+                     (rng.choice(DATES), student, course))
+    elif action == 4:
+        conn.execute("DELETE FROM attendance WHERE student_id = ? AND course_id = ? AND date = ?",
+                     (student, course, date))
+    else:
+        conn.execute("DELETE FROM attendance WHERE course_id = ? AND date = ?", (course, date))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_triggers_keep_rollups_equal_to_group_by(conn, seed):
+    rng = random.Random(seed)
+    for _ in range(40):
+        with conn:
+            for _ in range(rng.randint(1, 10)):
+                random_write(conn, rng)
+        assert rollups(conn) == grouped(conn)
+    # Days and months left without rows have no rollup row either
+    with conn:
+        conn.execute("DELETE FROM attendance")
+    assert rollups(conn) == ([], [])
+
+
+def test_rolled_back_writes_leave_rollups_unchanged(conn):
+    with conn:
+        conn.execute(MARK_PRESENT, (1, DATES[0], "2003101"))
+    before = rollups(conn)
+    with pytest.raises(sqlite3.IntegrityError):
+        with conn:
+            conn.execute(MARK_PRESENT, (1, DATES[0], "2003102"))
+            conn.execute("INSERT INTO attendance (student_id, course_id, date, present) VALUES (1, 1, ?, 0)",
+                         (DATES[0],))
+    assert rollups(conn) == before
+
+
+def test_rebuild_rollups_repairs_drift(conn):
+    rng = random.Random(0)
+    with conn:
+        for _ in range(200):
+            random_write(conn, rng)
+        conn.execute("UPDATE attendance_daily SET present = present + 1")
+        conn.execute("DELETE FROM attendance_monthly WHERE course_id = 1")
+        conn.execute("INSERT INTO attendance_daily VALUES ('2024-12-31', 1, 3, 3)")
+    assert rollups(conn) != grouped(conn)
+    with conn:
+        rebuild_rollups(conn)
+    assert rollups(conn) == grouped(conn)
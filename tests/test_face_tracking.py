@@ -0,0 +1,109 @@
+import itertools
+
+import dlib
+import numpy as np
+import pytest
+
+from face_tracking import CentroidTracker, SessionTracker, assign, face_rois, linear_assignment
+
+
+def brute_force_cost(cost):
+    n, m = cost.shape
+    if n <= m:
+        return min(cost[range(n), cols].sum() for cols in itertools.permutations(range(m), n))
+    return min(cost[rows, range(m)].sum() for rows in itertools.permutations(range(n), m))
+
+
+@pytest.mark.parametrize("shape", [(1, 1), (2, 2), (3, 3), (4, 4), (5, 5), (2, 5), (5, 2), (3, 6), (6, 4)])
+def test_linear_assignment_matches_brute_force(shape):
+    rng = np.random.default_rng(sum(shape))
+    for _ in range(20):
+        cost = rng.random(shape) * 100
+        rows, cols = linear_assignment(cost)
+        assert len(rows) == min(shape)
+        assert len(set(rows)) == len(rows) and len(set(cols)) == len(cols)
+        assert list(rows) == sorted(rows)
+        assert cost[rows, cols].sum() == pytest.approx(brute_force_cost(cost))
+
+
+def test_linear_assignment_with_ties_and_empty_input():
+    rows, cols = linear_assignment(np.ones((3, 3)))
+    assert sorted(cols) == [0, 1, 2]
+    rows, cols = linear_assignment(np.empty((0, 4)))
+    assert len(rows) == len(cols) == 0
+
+
+def test_assign_never_matches_beyond_the_gate():
+    distances = np.array([[1.0, 50.0], [50.0, 60.0]])
+    assigned = assign(distances, gates=np.array([10.0, 10.0]))
+    assert list(assigned) == [0, -1]
+
+
+def test_centroid_tracker_carries_labels_and_ages_tracks():
+    tracker = CentroidTracker(gate_ratio=0.5, max_missed=2)
+    widths = [100, 100]
+    assert tracker.update([[100, 100], [400, 100]], widths, labels=["alice", "bob"]) == ["alice", "bob"]
+    # Small movement keeps the labels, in whatever order the faces are detected
+    assert tracker.update([[410, 105], [105, 98]], widths) == ["bob", "alice"]
+    # A new face far from both tracks is unknown
+    assert tracker.update([[105, 98], [410, 105], [700, 300]], [100, 100, 100]) == ["alice", "bob", "unknown"]
+
+    # Bob is hidden for max_missed frames and still gets his label back
+    for _ in range(2):
+        tracker.update([[105, 98]], [100])
+    assert tracker.update([[105, 98], [410, 105]], widths) == ["alice", "bob"]
+
+    # Hidden for longer, his track is dropped
+    for _ in range(3):
+        tracker.update([[105, 98]], [100])
+    assert tracker.update([[105, 98], [410, 105]], widths) == ["alice", "unknown"]
+
+
+def test_centroid_tracker_does_not_follow_a_face_that_jumped():
+    tracker = CentroidTracker(gate_ratio=0.5)
+    tracker.update([[100, 100]], [100], labels=["alice"])
+    assert tracker.update([[300, 100]], [100]) == ["unknown"]
+
+
+def rect(x, y, size=100):
+    return dlib.rectangle(x, y, x + size, y + size)
+
+
+def confident(roll):
+    return {"name": roll, "roll": roll, "distance": 0.2, "candidates": []}
+
+
+def test_session_tracks_expire_between_slow_snapshots():
+    tracker = SessionTracker(reclassify_interval=10, max_age=0.5)
+    [track] = tracker.update([rect(100, 100)], now=0.0)
+    tracker.set_match(track, confident("1"))
+    [same] = tracker.update([rect(105, 100)], now=0.2)
+    assert same is track and not tracker.needs_descriptor(same)
+    # A snapshot seconds later never inherits the identity, even in the same spot
+    [fresh] = tracker.update([rect(105, 100)], now=3.0)
+    assert fresh is not track and tracker.needs_descriptor(fresh)
+
+
+def test_session_tracks_are_re_embedded_periodically_and_for_larger_top_k():
+    tracker = SessionTracker(reclassify_interval=3, max_age=0.5)
+    [track] = tracker.update([rect(100, 100)], now=0.0)
+    tracker.set_match(track, confident("1"), top_k=1)
+    assert tracker.needs_descriptor(track, top_k=3)
+    for i in range(1, 3):
+        tracker.update([rect(100, 100)], now=0.1 * i)
+        assert not tracker.needs_descriptor(track)
+    tracker.update([rect(100, 100)], now=0.3)
+    assert tracker.needs_descriptor(track)
+
+
+def test_borderline_matches_are_always_re_embedded():
+    tracker = SessionTracker(max_age=0.5)
+    [track] = tracker.update([rect(100, 100)], now=0.0)
+    tracker.set_match(track, {"name": "1", "roll": "1", "distance": 0.45, "candidates": []})
+    tracker.update([rect(100, 100)], now=0.1)
+    assert tracker.needs_descriptor(track)
+
+
+def test_face_rois_merge_overlapping_regions_and_clip_to_the_frame():
+    rois = face_rois([rect(10, 10, 50), rect(60, 10, 50), rect(400, 300, 50)], 480, 360, margin=0.5)
+    assert rois == [(0, 0, 136, 86), (375, 275, 476, 360)]
@@ -0,0 +1,113 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from frame_ring import FrameRing, RingStream
+
+SHAPE = (4, 6, 3)
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(SHAPE, slots=4, create=True)
+    yield ring
+    ring.release(unlink=True)
+
+
+def frame(value):
+    return np.full(SHAPE, value, dtype=np.uint8)
+
+
+def test_frames_read_back_as_private_copies(ring):
+    assert ring.write(frame(1)) == 0
+    copy = ring.read(0)
+    assert np.array_equal(copy, frame(1))
+    # Later writes into the slot do not reach a copy already handed out
+    for value in range(2, 6):
+        ring.write(frame(value))
+    assert np.array_equal(copy, frame(1))
+
+
+def test_overwritten_slot_is_detected(ring):
+    for value in range(5):
+        ring.write(frame(value))
+    # Slot 0 now holds frame 4
+    assert ring.read(0) is None and not ring.is_valid(0)
+    assert np.array_equal(ring.read(4), frame(4))
+    for frame_no in range(1, 4):
+        assert ring.is_valid(frame_no)
+
+
+def test_slot_being_written_is_not_readable(ring):
+    frame_no, view = ring.begin_write()
+    view[:] = 7
+    assert ring.read(frame_no) is None
+    ring.commit(frame_no)
+    assert np.array_equal(ring.read(frame_no), frame(7))
+
+
+def test_slot_reused_during_the_copy_is_dropped(ring, monkeypatch):
+    ring.write(frame(1))
+    original_view = ring.view
+
+    def view_then_lap(frame_no):
+        # The writer wraps around the ring while the reader holds the view
+        found = original_view(frame_no)
+        for value in range(2, 6):
+            ring.write(frame(value))
+        return found
+
+    monkeypatch.setattr(ring, "view", view_then_lap)
+    assert ring.read(0) is None
+
+
+def test_ring_stream_reads_newest_frames_until_closed(ring):
+    stream = RingStream(ring)
+    ring.write(frame(1))
+    ring.write(frame(2))
+    ok, img = stream.read()
+    assert ok and np.array_equal(img, frame(2))
+    ring.write(frame(3))
+    ring.close()
+    assert stream.isOpened()
+    ok, img = stream.read()
+    assert ok and np.array_equal(img, frame(3))
+    assert not stream.isOpened()
+    assert stream.read() == (False, None)
+
+
+def test_ring_stream_counts_frames_overwritten_before_the_copy(ring, monkeypatch):
+    stream = RingStream(ring)
+    ring.write(frame(1))
+    original_read = ring.read
+    laps = iter([True, False])
+
+    def read_after_lap(frame_no):
+        if next(laps):
+            for value in range(2, 6):
+                ring.write(frame(value))
+        return original_read(frame_no)
+
+    monkeypatch.setattr(ring, "read", read_after_lap)
+    ok, img = stream.read()
+    assert ok and np.array_equal(img, frame(5))
+    assert stream.overwritten == 1
+
+
+def _write_frames(name, count):
+    ring = FrameRing(SHAPE, slots=4, name=name)
+    for value in range(count):
+        ring.write(frame(value))
+    ring.close()
+    ring.release()
+
+
+def test_frames_cross_processes_through_shared_memory(ring):
+    process = multiprocessing.get_context("fork").Process(target=_write_frames, args=(ring.name, 10))
+    process.start()
+    process.join(10)
+    assert process.exitcode == 0
+    assert ring.head == 10 and ring.closed
+    assert np.array_equal(ring.read(9), frame(9))
+    assert ring.read(5) is None
@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+from attendance_buffer import MARK_PRESENT
+from migrations import SCHEMA_VERSION, migrate, schema_version
+
+DATE = "2025-03-10"
+
+
+@pytest.fixture
+def conn(base_db):
+    conn = sqlite3.connect(base_db)
+    yield conn
+    conn.close()
+
+
+def rows(conn, date=DATE):
+    return conn.execute("SELECT student_id, course_id, present FROM attendance WHERE date = ? "
+                        "ORDER BY student_id, course_id", (date,)).fetchall()
+
+
+def insert(conn, *attendance):
+    with conn:
+        conn.executemany("INSERT INTO attendance (student_id, course_id, date, present) VALUES (?, ?, ?, ?)",
+                         attendance)
+
+
+def test_dedupe_keeps_the_present_row_of_duplicates(base_db, conn):
+    insert(conn,
+           (1, 1, DATE, 0), (1, 1, DATE, 1), (1, 1, DATE, 0),     # present once
+           (2, 1, DATE, 0), (2, 1, DATE, 0),                      # never present
+           (2, 2, DATE, 1),                                       # no duplicate
+           (1, 1, "2025-03-11", 0))                               # another day
+    assert migrate(base_db) == list(range(1, SCHEMA_VERSION + 1))
+    assert rows(conn) == [(1, 1, 1), (2, 1, 0), (2, 2, 1)]
+    assert rows(conn, "2025-03-11") == [(1, 1, 0)]
+    with pytest.raises(sqlite3.IntegrityError):
+        insert(conn, (1, 1, DATE, 0))
+
+
+def test_migrate_is_idempotent(base_db, conn):
+    migrate(base_db)
+    assert schema_version(conn) == SCHEMA_VERSION
+    insert(conn, (3, 1, DATE, 1))
+    assert migrate(base_db) == []
+    assert schema_version(conn) == SCHEMA_VERSION
+    assert rows(conn) == [(3, 1, 1)]
+
+
+def test_mark_present_inserts_and_updates_absent_rows(base_db, conn):
+    migrate(base_db)
+    insert(conn, (2, 1, DATE, 0))
+    with conn:
+        for roll in ("2003101", "2003102", "2003101", "9999999"):
+            conn.execute(MARK_PRESENT, (1, DATE, roll))
+    assert rows(conn) == [(1, 1, 1), (2, 1, 1)]
+
+
+def test_prepopulation_keeps_existing_rows(base_db, conn):
+    migrate(base_db)
+    insert(conn, (4, 1, DATE, 1))
+    prepopulate = ("INSERT OR IGNORE INTO attendance (student_id, course_id, date, present) "
+                   "SELECT id, ?, ?, 0 FROM students")
+    with conn:
+        conn.execute(prepopulate, (1, DATE))
+        conn.execute(prepopulate, (1, DATE))
+    found = rows(conn)
+    assert len(found) == 10
+    assert [present for student, _, present in found if student == 4] == [1]
+    assert sum(present for _, _, present in found) == 1
@@ -0,0 +1,41 @@
+import random
+import sqlite3
+
+import pytest
+
+from migrations import PLAN_CHECKS, check_plans, migrate
+
+
+@pytest.fixture
+def migrated_db(base_db):
+    migrate(base_db)
+    conn = sqlite3.connect(base_db)
+    rng = random.Random(0)
+    with conn:
+        conn.executemany(
+            "INSERT INTO attendance (student_id, course_id, date, present) VALUES (?, ?, ?, ?)",
+            [(student, course, f"2025-{month:02d}-{day:02d}", rng.randint(0, 1))
+             for student in range(1, 11) for course in (1, 2) for month in (1, 2, 3) for day in (3, 10, 17)])
+    yield conn
+    conn.close()
+
+
+def test_every_query_branch_is_checked():
+    names = [name for name, _, _, _ in PLAN_CHECKS]
+    assert len(names) == len(set(names))
+    for query in ("_calculate_overall_attendance", "_calculate_course_stats", "_calculate_attendance_trend"):
+        assert f"{query}: period" in names and f"{query}: all time" in names
+    assert sum(name.startswith("_calculate_low_attendance_students") for name in names) == 4
+
+
+@pytest.mark.parametrize("check", PLAN_CHECKS, ids=[name for name, _, _, _ in PLAN_CHECKS])
+def test_query_plan(migrated_db, check, monkeypatch):
+    monkeypatch.setattr("migrations.PLAN_CHECKS", [check])
+    [(name, plan, ok)] = check_plans(migrated_db)
+    assert ok, f"{name} scans a table it should search:\n" + "\n".join(plan)
+
+
+def test_missing_index_is_reported(migrated_db):
+    migrated_db.execute("DROP INDEX idx_attendance_course_date")
+    failed = [name for name, _, ok in check_plans(migrated_db) if not ok]
+    assert "_calculate_low_attendance_students: course" in failed
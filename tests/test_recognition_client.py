@@ -0,0 +1,152 @@
+import json
+import socket
+import struct
+import threading
+
+import numpy as np
+import pytest
+
+from recognition_client import (FRAME_ENCODED, FRAME_RAW_BGR, HEADER, MAGIC, MAX_PAYLOAD, OP_RECOGNIZE,
+                                OP_RECOGNIZE_SESSION, OP_STATS, STATUS_ERROR, STATUS_OK, TRACKING,
+                                RecognitionClient, RecognitionServiceError, decode_matches, encode_frame,
+                                encode_matches, iter_frames, pack_text, read_message, send_message, unpack_text)
+
+
+# Distances are exact in float32, the wire format
+def match(name, roll, distance, candidates):
+    return {"name": name, "roll": roll, "distance": distance,
+            "candidates": [{"name": n, "roll": r, "distance": d} for n, r, d in candidates]}
+
+
+UNKNOWN = {"name": "Unknown", "roll": "-", "distance": None,
+           "candidates": [{"name": "Bushra", "roll": "2003107", "distance": 0.75}]}
+
+
+def test_matches_round_trip():
+    frames = [
+        [match("Shaon", "2003106", 0.25, [("Shaon", "2003106", 0.25), ("Irfan", "2003101", 0.5)]), UNKNOWN],
+        [],
+        [match("Ünïcødé 名前", "R-1", 0.125, [("Ünïcødé 名前", "R-1", 0.125)])],
+    ]
+    decoded = decode_matches(b"".join(encode_matches(frames)), len(frames))
+    assert decoded == frames
+
+
+def test_unknown_face_without_candidates_round_trips():
+    face = {"name": "Unknown", "roll": "-", "distance": None, "candidates": []}
+    assert decode_matches(b"".join(encode_matches([[face]])), 1) == [[face]]
+
+
+def test_text_is_length_prefixed_and_truncated():
+    data = pack_text("x" * 300)
+    assert data[0] == 255 and len(data) == 256
+    assert unpack_text(pack_text("roll") + b"rest", 0) == ("roll", 5)
+
+
+def test_frames_round_trip_encoded_and_raw():
+    raw = np.arange(2 * 3 * 3, dtype=np.uint8).reshape(2, 3, 3)
+    parts = encode_frame(b"\xff\xd8jpeg") + encode_frame(raw[:, ::-1])
+    frames = list(iter_frames(b"".join(bytes(p) for p in parts), 2))
+    assert frames[0] == (FRAME_ENCODED, 0, 0, b"\xff\xd8jpeg")
+    kind, height, width, data = frames[1]
+    assert (kind, height, width) == (FRAME_RAW_BGR, 2, 3)
+    assert np.array_equal(np.frombuffer(data, np.uint8).reshape(2, 3, 3), raw[:, ::-1])
+
+
+def test_messages_are_framed_by_header():
+    a, b = socket.socketpair()
+    with a, b:
+        send_message(a, OP_RECOGNIZE, 3, 2, [b"abc", b"de"])
+        send_message(a, OP_STATS, 0, 0, [])
+        assert read_message(b) == (OP_RECOGNIZE, 3, 2, b"abcde")
+        assert read_message(b) == (OP_STATS, 0, 0, b"")
+        a.close()
+        assert read_message(b) is None
+
+
+def test_bad_magic_and_oversized_payloads_are_rejected():
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(HEADER.pack(b"XXXX", OP_STATS, 0, 0, 0))
+        with pytest.raises(ValueError):
+            read_message(b)
+        a.sendall(HEADER.pack(MAGIC, OP_STATS, 0, 0, MAX_PAYLOAD + 1))
+        with pytest.raises(ValueError):
+            read_message(b)
+
+
+def test_truncated_message_raises():
+    a, b = socket.socketpair()
+    with b:
+        a.sendall(HEADER.pack(MAGIC, OP_STATS, 0, 0, 10) + b"short")
+        a.close()
+        with pytest.raises(ConnectionError):
+            read_message(b)
+
+
+@pytest.fixture
+def service(tmp_path):
+    """Unix socket server answering like recognition_server.py with canned matches."""
+    path = str(tmp_path / "recognition.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen()
+    requests = []
+
+    def serve():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            with conn:
+                while (message := read_message(conn)) is not None:
+                    opcode, top_k, count, payload = message
+                    requests.append(message)
+                    if opcode == OP_RECOGNIZE:
+                        frames = list(iter_frames(payload, count))
+                        if any(data == b"bad" for _, _, _, data in frames):
+                            send_message(conn, STATUS_ERROR, 0, 0, [b"Could not decode image 0."])
+                            continue
+                        found = [[match("Shaon", "2003106", 0.25, [("Shaon", "2003106", 0.25)])] * top_k
+                                 for _ in frames]
+                        send_message(conn, STATUS_OK, 0, count, encode_matches(found))
+                    elif opcode == OP_RECOGNIZE_SESSION:
+                        assert unpack_text(payload, 0)[0] == "page-1"
+                        send_message(conn, STATUS_OK, 0, 1, [TRACKING.pack(1, 2), *encode_matches([[UNKNOWN]])])
+                    else:
+                        send_message(conn, STATUS_OK, 0, 0, [json.dumps({"pid": 1}).encode()])
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield path, requests
+    listener.close()
+
+
+def test_client_round_trips_through_a_service(service):
+    path, requests = service
+    client = RecognitionClient(path, timeout=5)
+    [matches] = client.recognize_batch([b"jpeg"], top_k=2)
+    assert [m["roll"] for m in matches] == ["2003106", "2003106"]
+    assert requests[-1][:3] == (OP_RECOGNIZE, 2, 1)
+
+    matches, counts = client.recognize_session(b"jpeg", "page-1")
+    assert matches == [UNKNOWN]
+    assert counts == {"descriptors_computed": 1, "descriptors_skipped": 2}
+    assert client.stats() == {"pid": 1}
+
+    with pytest.raises(RecognitionServiceError, match="Could not decode"):
+        client.recognize(b"bad")
+    # The connection is still usable after an error answer
+    assert client.recognize(b"jpeg")[0]["name"] == "Shaon"
+
+
+def test_client_reports_a_missing_service(tmp_path):
+    client = RecognitionClient(str(tmp_path / "nothing.sock"), timeout=1)
+    with pytest.raises(RecognitionServiceError, match="cannot connect"):
+        client.stats()
+
+
+def test_distance_is_sent_as_float32():
+    [face] = decode_matches(b"".join(encode_matches([[match("a", "1", 0.1, [("a", "1", 0.1)])]])), 1)[0]
+    assert face["distance"] == pytest.approx(struct.unpack("!f", struct.pack("!f", 0.1))[0])